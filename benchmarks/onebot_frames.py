@@ -0,0 +1,117 @@
+"""OneBot 帧解码基准测试
+
+对比原先的 json.loads + CQEvent.from_payload 路径与 im_api.drivers.onebot 的解码路径，
+帧构成模拟繁忙群聊：大部分为心跳和 API 响应，少部分为消息。
+
+用法: python benchmarks/onebot_frames.py [帧数]
+"""
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from aiocqhttp import Event as CQEvent
+
+from im_api.drivers.onebot import JSON_BACKEND, FrameType, build_event, build_message, classify_frame, loads
+from im_api.models.message import Message, User, Channel
+from im_api.models.platform import Platform
+
+
+def make_frames(count: int) -> list:
+    rng = random.Random(0)
+    frames = []
+    for i in range(count):
+        kind = rng.random()
+        if kind < 0.5:
+            data = {
+                "time": 1700000000 + i, "self_id": 10001, "post_type": "meta_event",
+                "meta_event_type": "heartbeat", "interval": 5000,
+                "status": {"online": True, "good": True, "app_initialized": True, "app_enabled": True,
+                           "plugins_good": True, "app_good": True},
+            }
+        elif kind < 0.7:
+            data = {"status": "ok", "retcode": 0, "data": {"message_id": i}, "echo": str(i)}
+        elif kind < 0.95:
+            data = {
+                "time": 1700000000 + i, "self_id": 10001, "post_type": "message", "message_type": "group",
+                "sub_type": "normal", "message_id": i, "group_id": 123456, "user_id": 20000 + i % 50,
+                "message": f"[CQ:at,qq=10001] hello world {i}", "raw_message": f"[CQ:at,qq=10001] hello world {i}",
+                "font": 0, "sender": {"user_id": 20000 + i % 50, "nickname": f"user{i % 50}", "card": "",
+                                      "role": "member"},
+            }
+        else:
+            data = {
+                "time": 1700000000 + i, "self_id": 10001, "post_type": "notice", "notice_type": "group_increase",
+                "sub_type": "approve", "group_id": 123456, "operator_id": 0, "user_id": 30000 + i,
+            }
+        frames.append(json.dumps(data, ensure_ascii=False))
+    return frames
+
+
+def legacy_path(raw: str):
+    """原先 handle_ws/connect_ws 中的处理方式"""
+    data = json.loads(raw)
+    if data.get("meta_event_type") in ["lifecycle", "heartbeat"] or data.get("status") == "ok":
+        return None
+    event = CQEvent.from_payload(data)
+    if event.type == "message":
+        return Message(
+            id=str(event.message_id),
+            content=event.message,
+            channel=Channel(
+                id=str(event.group_id) if event.group_id else str(event.user_id),
+                type="group" if event.group_id else "private",
+                name=event.group_name if hasattr(event, 'group_name') else None
+            ),
+            user=User(
+                id=str(event.user_id),
+                name=event.sender.get("nickname", ""),
+                avatar=f"http://q1.qlogo.cn/g?b=qq&nk={event.user_id}&s=640"
+            ),
+            platform=Platform.QQ
+        )
+    return event
+
+
+def decoder_path(raw: str):
+    """QQDriver.handle_frame 中的处理方式"""
+    frame_type = classify_frame(raw)
+    if frame_type == FrameType.META:
+        return None
+    data = loads(raw)
+    if frame_type == FrameType.RESPONSE:
+        return data
+    post_type = data.get("post_type")
+    if post_type == "message":
+        return build_message(data)
+    if post_type == "notice":
+        return build_event(data)
+    return None
+
+
+def bench(name: str, func, frames: list, rounds: int = 5) -> float:
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for raw in frames:
+            func(raw)
+        best = min(best, time.perf_counter() - start)
+    rate = len(frames) / best
+    print(f"{name:<10} {rate:>12,.0f} frames/s")
+    return rate
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    frames = make_frames(count)
+    print(f"{count} frames, JSON backend: {JSON_BACKEND}")
+    before = bench("legacy", legacy_path, frames)
+    after = bench("decoder", decoder_path, frames)
+    print(f"speedup    {after / before:>12.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,8 @@
 import shutil
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from enum import Enum
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Union
 import yaml
 
 from im_api.models.platform import Platform
@@ -26,10 +26,83 @@ class WSServerConfig:
 @dataclass
 class WsClientConfig:
     """正向WebSocket配置"""
-    ws_url: str = "ws://127.0.0.1:6700"
+    ws_url: Union[str, List[str]] = "ws://127.0.0.1:6700"  # 可填写多个地址，按顺序故障切换
     access_token: str = ""
     heartbeat: int = 30
 
+@dataclass
+class HttpConfig:
+    """HTTP配置"""
+    api_url: str = "http://127.0.0.1:5700"  # OneBot HTTP API 地址
+    access_token: str = ""
+    max_connections: int = 16  # 调用 API 的最大并发连接数
+    host: str = "0.0.0.0"       # 事件上报的监听地址
+    port: int = 8081
+    path: str = "/onebot/"      # 事件上报路径
+    secret: str = ""            # 事件上报签名密钥，留空则不验证
+
+class TelegramMode(Enum):
+    """Telegram接收模式"""
+    POLLING = "polling"  # 长轮询 getUpdates
+    WEBHOOK = "webhook"  # 由 Telegram 推送到本地 HTTP 服务
+
+@dataclass
+class TelegramWebhookConfig:
+    """Telegram Webhook配置"""
+    host: str = "127.0.0.1"
+    port: int = 8443
+    path: str = "/telegram"
+    secret_token: str = ""  # 校验 X-Telegram-Bot-Api-Secret-Token 请求头，留空则不验证
+    url: str = ""           # 对外的 Webhook 地址，填写后启动时自动调用 setWebhook
+
+class MatrixMode(Enum):
+    """Matrix接收模式"""
+    SYNC = "sync"              # 客户端长轮询同步
+    APPSERVICE = "appservice"  # 应用服务，由家服务器推送事务
+
+@dataclass
+class MatrixAppServiceConfig:
+    """Matrix应用服务配置"""
+    host: str = "127.0.0.1"
+    port: int = 8009
+    hs_token: str = ""  # 家服务器推送事务时携带的令牌
+
+@dataclass
+class MatrixSyncConfig:
+    """Matrix同步配置"""
+    persist: bool = True          # 是否持久化同步进度和房间状态
+    backlog: str = "none"         # 重启后补发的离线消息: none/recent/all
+    backlog_max_age: int = 300    # backlog 为 recent 时补发消息的最长时间（秒）
+    rooms: List[str] = field(default_factory=list)  # 只同步这些房间，留空则同步全部房间
+    timeline_limit: int = 20      # 每个房间每次同步返回的最多事件数
+    lazy_load_members: bool = True  # 只同步发言用户的成员信息
+
+@dataclass
+class SpoolConfig:
+    """出站日志配置"""
+    enabled: bool = False      # 平台不可用时将消息写入日志，恢复后按频道顺序重发
+    max_entries: int = 10000   # 日志中最多保留的消息数，超出时丢弃最早的
+    max_age: int = 86400       # 消息最长保留时间（秒）
+    max_attempts: int = 5      # 每条消息最多重发次数
+
+class OverflowPolicy(Enum):
+    """入站队列已满时的处理方式"""
+    BLOCK = "block"              # 等待队列有空位，超过 block_timeout 则丢弃新事件
+    DROP_OLDEST = "drop_oldest"  # 丢弃最早的事件
+    DROP_NEWEST = "drop_newest"  # 丢弃新事件
+
+@dataclass
+class InboundConfig:
+    """入站事件分发配置"""
+    queue_size: int = 1024       # 每个分发线程的队列长度
+    overflow: OverflowPolicy = OverflowPolicy.DROP_OLDEST
+    block_timeout: float = 5     # overflow 为 block 时最长等待时间（秒）
+    workers: int = 1             # 分发线程数，同一频道的事件始终由同一线程按顺序分发
+    batch_size: int = 32         # 分发线程每次从队列取出的最多事件数
+
+    def __post_init__(self):
+        self.overflow = OverflowPolicy(self.overflow)
+
 class DriverConfig:
     """驱动配置基类"""
     enabled: bool = False
@@ -45,23 +118,29 @@ class QQConfig(DriverConfig):
     connection_type: ConnectionType = ConnectionType.WS_SERVER
     client: WsClientConfig = WsClientConfig()
     server: WSServerConfig = WSServerConfig()
+    http: HttpConfig = HttpConfig()
     
-    def __init__(self, enabled: bool, platform: str, connection_type: str, client: dict, server: dict):
+    def __init__(self, enabled: bool, platform: str, connection_type: str, client: dict, server: dict, http: dict):
         super().__init__(enabled, platform)
         self.connection_type = ConnectionType(connection_type)
         self.client = WsClientConfig(**client)
         self.server = WSServerConfig(**server)
+        self.http = HttpConfig(**http)
 
 
 class TelegramConfig(DriverConfig):
     """TG驱动配置"""
     token: str
     http_proxy: str
+    mode: TelegramMode = TelegramMode.POLLING
+    webhook: TelegramWebhookConfig = TelegramWebhookConfig()
     
-    def __init__(self, enabled: bool, token: str, http_proxy: str):
+    def __init__(self, enabled: bool, token: str, http_proxy: str, mode: str, webhook: dict):
         super().__init__(enabled, Platform.TELEGRAM)
         self.token = token
         self.http_proxy = http_proxy
+        self.mode = TelegramMode(mode)
+        self.webhook = TelegramWebhookConfig(**webhook)
 
 class MatrixConfig(DriverConfig):
     """Matrix驱动配置"""
@@ -70,19 +149,29 @@ class MatrixConfig(DriverConfig):
         'token': str 
     }
     homeserver: str
+    mode: MatrixMode = MatrixMode.SYNC
+    sync: MatrixSyncConfig = MatrixSyncConfig()
+    appservice: MatrixAppServiceConfig = MatrixAppServiceConfig()
 
-    def __init__(self, enabled: bool, account: dict, homeserver: str):
+    def __init__(self, enabled: bool, account: dict, homeserver: str, mode: str, sync: dict, appservice: dict):
         super().__init__(enabled, Platform.MATRIX)
         self.user_id = account.get('user_id', None)
         self.token = account.get('token', None)
         self.homeserver = homeserver if homeserver.startswith("https://") else "https://" + homeserver
+        self.mode = MatrixMode(mode)
+        self.sync = MatrixSyncConfig(**sync)
+        self.appservice = MatrixAppServiceConfig(**appservice)
 
 class ImAPIConfig:
     """ImAPI配置"""
     drivers: List[DriverConfig] = []
+    spool: SpoolConfig = SpoolConfig()
+    inbound: InboundConfig = InboundConfig()
     
-    def __init__(self, drivers: List[DriverConfig]):
+    def __init__(self, drivers: List[DriverConfig], spool: Optional[SpoolConfig] = None, inbound: Optional[InboundConfig] = None):
         self.drivers = drivers
+        self.spool = spool or SpoolConfig()
+        self.inbound = inbound or InboundConfig()
 
     @classmethod
     def load(cls, mcdr_work_dir: Path) -> 'ImAPIConfig':
@@ -130,22 +219,32 @@ class ImAPIConfig:
                     platform=platform,
                     connection_type=driver_data.get('connection_type', 'ws_server'),
                     server=driver_data.get('ws_server', {}),
-                    client=driver_data.get('ws_client', {})
+                    client=driver_data.get('ws_client', {}),
+                    http=driver_data.get('http', {})
                 ))
             elif platform == 'telegram':
                 drivers.append(TelegramConfig(
                     enabled=driver_data.get('enabled', False),
                     token=driver_data.get('token', ''),
-                    http_proxy=driver_data.get('http_proxy', '')
+                    http_proxy=driver_data.get('http_proxy', ''),
+                    mode=driver_data.get('mode', 'polling'),
+                    webhook=driver_data.get('webhook', {})
                 ))
             elif platform == 'matrix':
                 drivers.append(MatrixConfig(
                     enabled=driver_data.get('enabled', False),
                     account=driver_data.get('account', None),
-                    homeserver=driver_data.get('homeserver', 'example.com')
+                    homeserver=driver_data.get('homeserver', 'example.com'),
+                    mode=driver_data.get('mode', 'sync'),
+                    sync=driver_data.get('sync', {}),
+                    appservice=driver_data.get('appservice', {})
                 ))
 
-        return cls(drivers=drivers)
+        return cls(
+            drivers=drivers,
+            spool=SpoolConfig(**(data.get('spool') or {})),
+            inbound=InboundConfig(**(data.get('inbound') or {}))
+        )
 
     def save(self, plugin_dir: Path) -> None:
         """保存配置到文件
@@ -174,6 +273,15 @@ class ImAPIConfig:
                         'ws_url': driver.client.ws_url,
                         'access_token': driver.client.access_token,
                         'heartbeat': driver.client.heartbeat
+                    },
+                    'http': {
+                        'api_url': driver.http.api_url,
+                        'access_token': driver.http.access_token,
+                        'max_connections': driver.http.max_connections,
+                        'host': driver.http.host,
+                        'port': driver.http.port,
+                        'path': driver.http.path,
+                        'secret': driver.http.secret
                     }
                 }
             elif isinstance(driver, TelegramConfig):
@@ -181,7 +289,15 @@ class ImAPIConfig:
                     'enabled': driver.enabled,
                     'platform': 'telegram',
                     'token': driver.token,
-                    'http_proxy': driver.http_proxy
+                    'http_proxy': driver.http_proxy,
+                    'mode': driver.mode.value,
+                    'webhook': {
+                        'host': driver.webhook.host,
+                        'port': driver.webhook.port,
+                        'path': driver.webhook.path,
+                        'secret_token': driver.webhook.secret_token,
+                        'url': driver.webhook.url
+                    }
                 }
             elif isinstance(driver, MatrixConfig):
                 driver_data = {
@@ -191,11 +307,38 @@ class ImAPIConfig:
                         'user_id': driver.user_id,
                         'token': driver.token
                     },
-                    'homeserver': driver.homeserver
+                    'homeserver': driver.homeserver,
+                    'mode': driver.mode.value,
+                    'sync': {
+                        'persist': driver.sync.persist,
+                        'backlog': driver.sync.backlog,
+                        'backlog_max_age': driver.sync.backlog_max_age,
+                        'rooms': driver.sync.rooms,
+                        'timeline_limit': driver.sync.timeline_limit,
+                        'lazy_load_members': driver.sync.lazy_load_members
+                    },
+                    'appservice': {
+                        'host': driver.appservice.host,
+                        'port': driver.appservice.port,
+                        'hs_token': driver.appservice.hs_token
+                    }
                 }
             else:
                 continue
             data['drivers'].append(driver_data)
+        data['spool'] = {
+            'enabled': self.spool.enabled,
+            'max_entries': self.spool.max_entries,
+            'max_age': self.spool.max_age,
+            'max_attempts': self.spool.max_attempts
+        }
+        data['inbound'] = {
+            'queue_size': self.inbound.queue_size,
+            'overflow': self.inbound.overflow.value,
+            'block_timeout': self.inbound.block_timeout,
+            'workers': self.inbound.workers,
+            'batch_size': self.inbound.batch_size
+        }
 
         # 保存到文件
         with open(config_file, 'w', encoding='utf-8') as f:
@@ -206,8 +349,9 @@ class ImAPIConfig:
 __all__ = [
     'ImAPIConfig', 'DriverConfig',
     'QQConfig', 'KookConfig', 'DiscordConfig', 'MatrixConfig',
-    'WSServerConfig', 'WsClientConfig',
-    'ConnectionType'
+    'WSServerConfig', 'WsClientConfig', 'HttpConfig', 'TelegramWebhookConfig',
+    'MatrixSyncConfig', 'MatrixAppServiceConfig', 'SpoolConfig', 'InboundConfig',
+    'ConnectionType', 'TelegramMode', 'MatrixMode', 'OverflowPolicy'
 ]
 
 
@@ -1,49 +1,406 @@
-from typing import Any, Dict, Optional, Callable, List
+import asyncio
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Awaitable, Dict, Optional, Callable, List, Set, Tuple, Union
 
 from mcdreforged.api.all import *
 
 from im_api.core.driver import DriverManager
 from im_api.core.context import Context
+from im_api.core.spool import OutboundSpool, SpoolEntry
+from im_api.drivers.base import BaseDriver, PermanentSendError
 from im_api.models.message import Event, Message
 from im_api.models.platform import Platform
-from im_api.models.request import SendMessageRequest, MessageType
+from im_api.models.request import ChannelInfo, SendMessageRequest, SendResult, SendStatus, MessageType
+
+SendCallback = Callable[[Dict[Platform, SendResult]], None]
 
 
 class MessageBridge:
-    """消息桥接器，负责在 MCDR 和 IM 平台之间转换消息"""
+    """消息桥接器，负责在 MCDR 和 IM 平台之间转换消息
+
+    发送由桥接器自己的事件循环调度：驱动的 submit_messages 在线程池中并发执行，
+    总时限由事件循环计时，调用方立即得到 Future，不会阻塞 MCDR 的线程。
+    超过总时限的消息不会被取消，在后台继续发送。
+    启用出站日志时，平台不可用或发送失败的消息写入日志，由重发循环在平台恢复后补发。
+    """
+
+    SEND_TIMEOUT = 8  # 一次发送的总时限（秒），各驱动在此期间并发发送
+    MAX_WORKERS = 8   # 发送线程数
+    REPLAY_INTERVAL = 5    # 检查待重发消息的间隔（秒）
+    COMPACT_INTERVAL = 300  # 整理出站日志的间隔（秒）
 
     def __init__(self, server: ServerInterface, driver_manager: DriverManager):
         """初始化消息桥接器"""
         self.server = server
         self.driver_manager = driver_manager
         self.logger = Context.get_instance().logger
+        # 驱动的 send_message 会阻塞到发送完成，在线程池中并发调用
+        self.executor = ThreadPoolExecutor(max_workers=self.MAX_WORKERS, thread_name_prefix="ImAPI-Sender")
+        self.event_loop = asyncio.new_event_loop()
+        self.loop_thread = threading.Thread(target=self.event_loop.run_forever, name="ImAPI-Bridge", daemon=True)
+        self.loop_thread.start()
+        self.spool = self.open_spool()
+        if self.spool is not None:
+            replaying = asyncio.run_coroutine_threadsafe(self.replay_loop(), self.event_loop)
+            replaying.add_done_callback(self.on_replay_exit)
         # 注册消息发送事件监听器
         self.server.register_event_listener(
             "im_api.send_message", self.on_send_message)
+        self.server.register_event_listener(
+            "im_api.send_messages", self.on_send_messages)
 
-    def on_send_message(self,server: PluginServerInterface, request: SendMessageRequest) -> List[str]:
+    def open_spool(self) -> Optional[OutboundSpool]:
+        """按配置打开出站日志，未启用或打开失败时返回 None"""
+        config = Context.get_instance().config
+        if config is None or not config.spool.enabled:
+            return None
+        try:
+            spool = OutboundSpool(Context.get_instance().get_data_dir() / 'spool.db', config.spool)
+        except Exception as e:
+            self.logger.error(f"Failed to open outbound spool: {e}")
+            return None
+        if spool.pending:
+            self.logger.info(f"Outbound spool has {spool.depth()} messages waiting to be resent")
+        return spool
+
+    def get_target_drivers(self, request: SendMessageRequest) -> List[BaseDriver]:
+        """获取请求的目标驱动，platforms 为 None 时返回所有驱动"""
+        drivers = self.driver_manager.get_all_drivers()
+        if request.platforms is None:
+            return drivers
+        platforms = {Platform.from_string(p) if isinstance(p, str) else p for p in request.platforms}
+        return [driver for driver in drivers if driver.get_platform() in platforms]
+
+    async def dispatch(self, requests: List[SendMessageRequest], timeout: float) -> List[Dict[Platform, SendResult]]:
+        """在桥接器的事件循环中发送，并在总时限到达时汇总结果
+
+        请求按目标驱动分组，每个驱动一次性收到自己的全部请求，各驱动之间并发发送。
         """
-        处理消息发送事件
-        :param request: 发送消息请求
-        :return: 消息ID列表，如果没有成功发送则返回空列表
+        targets: Dict[BaseDriver, List[int]] = {}
+        for index, request in enumerate(requests):
+            for driver in self.get_target_drivers(request):
+                targets.setdefault(driver, []).append(index)
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        results: List[Dict[Platform, SendResult]] = [{} for _ in requests]
+        submissions: Dict['Future[List[Future]]', Tuple[Platform, List[int]]] = {}
+        for driver, indexes in targets.items():
+            platform = driver.get_platform()
+            entry_ids = None
+            if self.spool is not None:
+                indexes, entry_ids = self.journal(driver, requests, indexes, results)
+                if not indexes:
+                    continue
+            submitted = self.executor.submit(driver.submit_messages, [requests[i] for i in indexes])
+            if entry_ids is not None:
+                # 以每条消息的实际完成情况确认日志，超过总时限的发送完成后同样会被确认
+                submitted.add_done_callback(lambda done, ids=entry_ids: self.settle(ids, done))
+            submissions[submitted] = (platform, indexes)
+        # 只等待而不取消：已开始的发送在后台继续完成
+        await self.wait_all(list(submissions), timeout)
+        pending = [future for submitted in submissions if submitted.done() and not submitted.cancelled()
+                   and submitted.exception() is None for future in submitted.result()]
+        remaining = deadline - loop.time()
+        if remaining > 0:
+            await self.wait_all(pending, remaining)
+
+        for submitted, (platform, indexes) in submissions.items():
+            permanent = [False] * len(indexes)
+            if not submitted.done():
+                # 尚未开始的提交可以取消，日志条目随后由 settle 推迟；已开始的在后台继续完成
+                if submitted.cancel():
+                    status, error = SendStatus.FAILED, f"Not started within {timeout}s"
+                else:
+                    status, error = SendStatus.TIMEOUT, f"Not finished within {timeout}s"
+                outcomes = [SendResult(platform, status, error=error) for _ in indexes]
+            elif submitted.exception() is not None:
+                outcomes = [SendResult(platform, SendStatus.FAILED, error=str(submitted.exception())) for _ in indexes]
+            else:
+                outcomes = [self.get_result(platform, future, timeout) for future in submitted.result()]
+                permanent = [self.is_permanent(future) for future in submitted.result()]
+            if self.spool is not None:
+                # 请求本身无效的消息不会重发，结果仍为 FAILED
+                outcomes = [
+                    SendResult(platform, SendStatus.QUEUED, error=result.error)
+                    if result.status == SendStatus.FAILED and not dropped else result
+                    for result, dropped in zip(outcomes, permanent)
+                ]
+            failed = sum(1 for result in outcomes if not result.ok)
+            if failed:
+                self.logger.warning(f"Failed to send {failed}/{len(outcomes)} messages via {platform.value}: {next(r for r in outcomes if not r.ok).error}")
+            for index, result in zip(indexes, outcomes):
+                results[index][platform] = result
+        return results
+
+    @staticmethod
+    async def wait_all(futures: List[Future], timeout: Optional[float] = None) -> None:
+        """在事件循环中等待 concurrent.futures.Future 完成或超时，超时后不会取消它们"""
+        if not futures:
+            return
+        waiters = [asyncio.wrap_future(future) for future in futures]
+        for waiter in waiters:
+            # 结果由调用方从原 Future 读取，这里只将异常标记为已处理
+            waiter.add_done_callback(lambda done: done.cancelled() or done.exception())
+        await asyncio.wait(waiters, timeout=timeout)
+
+    @staticmethod
+    def get_result(platform: Platform, future: 'Future[Optional[str]]', timeout: float) -> SendResult:
+        """将驱动返回的单条消息的 Future 转换为发送结果，未完成的为 TIMEOUT"""
+        if not future.done():
+            return SendResult(platform, SendStatus.TIMEOUT, error=f"Not finished within {timeout}s")
+        if future.cancelled():
+            return SendResult(platform, SendStatus.FAILED, error="Send cancelled")
+        if future.exception() is not None:
+            return SendResult(platform, SendStatus.FAILED, error=str(future.exception()))
+        if not future.result():
+            return SendResult(platform, SendStatus.FAILED, error="Driver did not return a message ID")
+        return SendResult(platform, SendStatus.SUCCESS, message_id=future.result())
+
+    def journal(self, driver: BaseDriver, requests: List[SendMessageRequest], indexes: List[int],
+                results: List[Dict[Platform, SendResult]]) -> Tuple[List[int], List[int]]:
+        """发送前写入出站日志
+
+        平台不可用，或频道已有待重发消息时，请求直接排入日志，结果为 QUEUED。
+
+        Returns:
+            需要立即发送的请求序号，以及对应的日志条目ID
         """
-        # 遍历所有驱动，处理发送请求
-        results = []
-        plats = request.platforms
-        for driver in self.driver_manager.get_all_drivers():
-            try:
-                # 只响应对应platform的消息事件
-                if driver.get_platform() not in plats:
-                    self.logger.debug(f'platform {driver.get_platform()} not match, Skip')
+        platform = driver.get_platform()
+        ready = driver.is_ready()
+        sending, entry_ids = [], []
+        for index in indexes:
+            request = requests[index]
+            if ready and not self.spool.is_pending(platform.value, request.channel_id):
+                sending.append(index)
+                entry_ids.append(self.spool.append(platform.value, request, queued=False))
+            else:
+                self.spool.append(platform.value, request, queued=True)
+                results[index][platform] = SendResult(platform, SendStatus.QUEUED, error="Platform unavailable, queued for resend")
+        return sending, entry_ids
+
+    def settle(self, entry_ids: List[int], submitted: 'Future[List[Future]]') -> None:
+        """提交完成后，在每条消息发送完成时确认或推迟日志条目
+
+        提交被取消或出错时消息均未发出，全部推迟。
+        """
+        if submitted.cancelled() or submitted.exception() is not None:
+            for entry_id in entry_ids:
+                self.release(entry_id, None)
+            return
+        for entry_id, future in zip(entry_ids, submitted.result()):
+            future.add_done_callback(lambda done, entry_id=entry_id: self.release(entry_id, done))
+
+    @staticmethod
+    def is_sent(future: 'Future[Optional[str]]') -> bool:
+        """单条消息是否发送成功"""
+        return not future.cancelled() and future.exception() is None and bool(future.result())
+
+    @staticmethod
+    def is_permanent(future: 'Future[Optional[str]]') -> bool:
+        """单条消息是否因请求本身无效而失败，这类失败重发也不会成功"""
+        return future.done() and not future.cancelled() and isinstance(future.exception(), PermanentSendError)
+
+    def release(self, entry_id: int, future: Optional['Future[Optional[str]]']) -> bool:
+        """按发送结果处理日志条目
+
+        发送成功或请求本身无效时删除，其他失败标记为待重发。future 为 None 表示消息未发出。
+
+        Returns:
+            是否发送成功
+        """
+        if future is not None and self.is_sent(future):
+            self.spool.ack(entry_id)
+            return True
+        if future is not None and self.is_permanent(future):
+            self.spool.ack(entry_id)
+            self.logger.warning(f"Dropped spooled message {entry_id}: {future.exception()}")
+        elif not self.spool.defer(entry_id):
+            self.logger.warning(f"Dropped spooled message {entry_id} after {self.spool.config.max_attempts} attempts")
+        return False
+
+    async def replay(self, driver: BaseDriver) -> None:
+        """按写入顺序重发平台的待重发消息
+
+        每轮发送每个频道最早的一条，不同频道并发、同一频道依次发送；
+        某个频道发送失败时，该频道本次不再继续，以免后续消息越过它；
+        请求本身无效的消息直接丢弃，不阻塞其后的消息。
+        每轮都等待所有消息发送完成，不会在发送中途重发同一条消息。
+        """
+        platform = driver.get_platform().value
+        channels: Dict[str, List[SpoolEntry]] = {}
+        for entry in self.spool.queued(platform):
+            channels.setdefault(entry.channel, []).append(entry)
+        if not channels:
+            self.spool.refresh(platform)
+            return
+
+        sent = 0
+        while channels and driver.is_ready():
+            heads = [queue.pop(0) for queue in channels.values()]
+            futures = await asyncio.wrap_future(self.executor.submit(driver.submit_messages, [entry.request for entry in heads]))
+            await self.wait_all(futures)
+            for entry, future in zip(heads, futures):
+                if self.release(entry.id, future):
+                    sent += 1
+                elif not self.is_permanent(future):
+                    channels[entry.channel].clear()
+            channels = {channel: queue for channel, queue in channels.items() if queue}
+        self.spool.refresh(platform)
+        if sent:
+            self.logger.info(f"Resent {sent} spooled messages via {platform}")
+
+    async def replay_loop(self) -> None:
+        """定期重发已恢复平台的待重发消息，并整理出站日志"""
+        last_compact = time.monotonic()
+        while True:
+            await asyncio.sleep(self.REPLAY_INTERVAL)
+            for driver in self.driver_manager.get_all_drivers():
+                try:
+                    if self.spool.has_queued(driver.get_platform().value) and driver.is_ready():
+                        await self.replay(driver)
+                except Exception as e:
+                    self.logger.error(f"Error resending spooled messages via {driver.get_platform()}: {e}")
+            if time.monotonic() - last_compact >= self.COMPACT_INTERVAL:
+                last_compact = time.monotonic()
+                try:
+                    dropped = self.spool.compact()
+                except Exception as e:
+                    self.logger.error(f"Error compacting outbound spool: {e}")
                     continue
-                result = driver.send_message(request)
-                if result:
-                    results.append(result)
+                if dropped:
+                    self.logger.warning(f"Dropped {dropped} expired spooled messages")
+
+    def on_replay_exit(self, done: Future) -> None:
+        """重发循环只应在关闭时被取消，其他原因退出时记录日志"""
+        if done.cancelled():
+            return
+        self.logger.error(f"Outbound spool replay stopped unexpectedly: {done.exception()}")
+
+    def schedule(self, coro: Awaitable[Any], callback: Optional[Callable[[Any], None]] = None) -> Future:
+        """在桥接器的事件循环中运行发送协程，完成后调用回调"""
+        future = asyncio.run_coroutine_threadsafe(coro, self.event_loop)
+
+        def on_done(done: Future):
+            if done.cancelled():
+                return
+            if done.exception() is not None:
+                self.logger.error(f"Error sending message: {done.exception()}")
+                return
+            if callback is None:
+                return
+            try:
+                callback(done.result())
             except Exception as e:
-                self.logger.error(f"Error sending message via driver {driver}: {e}")
+                self.logger.error(f"Error in send callback: {e}")
+        future.add_done_callback(on_done)
+        return future
 
-        return results
+    def submit(self, request: SendMessageRequest, callback: Optional[SendCallback] = None,
+               timeout: Optional[float] = None) -> 'Future[Dict[Platform, SendResult]]':
+        """提交发送请求，立即返回
+
+        Args:
+            request: 发送消息请求
+            callback: 发送完成后以各平台结果调用，在桥接器线程中执行，不应阻塞
+            timeout: 总时限（秒），默认为 SEND_TIMEOUT，超时的平台结果为 TIMEOUT
+
+        Returns:
+            结果为各平台发送结果的 Future
+        """
+        timeout = self.SEND_TIMEOUT if timeout is None else timeout
+
+        async def dispatch_one():
+            return (await self.dispatch([request], timeout))[0]
+
+        return self.schedule(dispatch_one(), callback)
+
+    def submit_batch(self, requests: List[SendMessageRequest],
+                     callback: Optional[Callable[[List[Dict[Platform, SendResult]]], None]] = None,
+                     timeout: Optional[float] = None) -> 'Future[List[Dict[Platform, SendResult]]]':
+        """批量提交发送请求，立即返回
+
+        Args:
+            requests: 发送消息请求列表
+            callback: 发送完成后以结果调用，在桥接器线程中执行，不应阻塞
+            timeout: 总时限（秒），默认为 SEND_TIMEOUT
+
+        Returns:
+            结果为与请求一一对应的各平台发送结果列表的 Future
+        """
+        timeout = self.SEND_TIMEOUT if timeout is None else timeout
+        return self.schedule(self.dispatch(requests, timeout), callback)
+
+    def multicast(self, content: str, channels: List[ChannelInfo], platforms: Optional[Set[Union[Platform, str]]] = None,
+                  callback: Optional[Callable[[List[Dict[Platform, SendResult]]], None]] = None,
+                  timeout: Optional[float] = None) -> 'Future[List[Dict[Platform, SendResult]]]':
+        """将同一内容发送到多个频道，立即返回
+
+        Args:
+            content: 消息内容
+            channels: 目标频道列表
+            platforms: 目标平台，None 表示所有平台
+            callback: 发送完成后以结果调用，不应阻塞
+            timeout: 总时限（秒），默认为 SEND_TIMEOUT
+
+        Returns:
+            结果为与频道一一对应的各平台发送结果列表的 Future
+        """
+        requests = [SendMessageRequest(channel=channel, content=content, platforms=platforms) for channel in channels]
+        return self.submit_batch(requests, callback, timeout)
+
+    async def send_async(self, request: SendMessageRequest, timeout: Optional[float] = None) -> Dict[Platform, SendResult]:
+        """在任意事件循环中等待发送完成"""
+        return await asyncio.wrap_future(self.submit(request, timeout=timeout))
+
+    def send(self, request: SendMessageRequest, timeout: Optional[float] = None) -> Dict[Platform, SendResult]:
+        """向所有目标平台并发发送消息，阻塞到完成或总时限到达
+
+        Args:
+            request: 发送消息请求
+            timeout: 总时限（秒），默认为 SEND_TIMEOUT，超时的平台结果为 TIMEOUT
+
+        Returns:
+            各平台的发送结果
+        """
+        return self.submit(request, timeout=timeout).result()
+
+    def on_send_message(self, server: PluginServerInterface, request: SendMessageRequest) -> 'Future[Dict[Platform, SendResult]]':
+        """
+        处理消息发送事件，不阻塞事件线程
+        :param request: 发送消息请求
+        :return: 结果为各平台发送结果的 Future
+        """
+        return self.submit(request)
+
+    async def close(self) -> None:
+        """取消所有进行中的发送并停止事件循环"""
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        asyncio.get_running_loop().stop()
+
+    def on_send_messages(self, server: PluginServerInterface, requests: List[SendMessageRequest]) -> 'Future[List[Dict[Platform, SendResult]]]':
+        """
+        处理批量消息发送事件，不阻塞事件线程
+        :param requests: 发送消息请求列表
+        :return: 结果为与请求一一对应的各平台发送结果列表的 Future
+        """
+        return self.submit_batch(requests)
+
+    def shutdown(self) -> None:
+        """停止事件循环和发送线程池，等待中的 Future 以取消结束"""
+        asyncio.run_coroutine_threadsafe(self.close(), self.event_loop)
+        self.loop_thread.join(timeout=1)
+        if not self.loop_thread.is_alive():
+            self.event_loop.close()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        if self.spool is not None:
+            self.spool.close()
 
 
 # 导出
-__all__ = ["MessageBridge"]
+__all__ = ["MessageBridge", "SendCallback"]
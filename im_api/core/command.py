@@ -0,0 +1,252 @@
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Tuple
+
+from im_api.models.message import Message, Segment
+from im_api.models.platform import Platform
+from im_api.models.request import ChannelInfo, MessageType, SendMessageRequest
+
+
+class ArgumentError(ValueError):
+    """命令参数不符合定义"""
+    pass
+
+
+@dataclass
+class Argument:
+    """命令参数定义"""
+    name: str
+    type: Callable[[str], Any] = str  # 转换函数，如 int、float，抛出 ValueError 时视为参数错误
+    optional: bool = False
+    default: Any = None               # 可选参数缺省时的值
+    greedy: bool = False              # 取剩余的全部文本，只能是最后一个参数
+
+    @property
+    def usage(self) -> str:
+        name = f"{self.name}..." if self.greedy else self.name
+        return f"[{name}]" if self.optional else f"<{name}>"
+
+
+@dataclass
+class CommandContext:
+    """命令调用上下文"""
+    command: 'Command'
+    platform: Platform
+    message: Message
+    args: Dict[str, Any]
+    sender: Callable[[SendMessageRequest], Any] = field(repr=False)
+
+    def reply(self, content: str) -> Any:
+        """向命令所在的频道发送纯文本回复，返回发送的 Future"""
+        channel = self.message.channel
+        return self.sender(SendMessageRequest(
+            channel=ChannelInfo(id=channel.id, type=MessageType.PRIVATE if channel.type == "private" else MessageType.CHANNEL),
+            content=content,
+            platforms={self.platform},
+            segments=[Segment.text(content)]
+        ))
+
+
+CommandHandler = Callable[[CommandContext], None]
+PermissionCheck = Callable[[Platform, Message], bool]
+
+
+@dataclass(eq=False)
+class Command:
+    """已注册的命令"""
+    prefix: str
+    handler: CommandHandler
+    arguments: List[Argument] = field(default_factory=list)
+    cooldown: float = 0                            # 同一用户两次调用的最短间隔（秒）
+    permission: Optional[PermissionCheck] = None   # 返回 False 时忽略本次调用
+    platforms: Optional[FrozenSet[Platform]] = None  # 只响应这些平台，None 表示所有平台
+    description: str = ""
+    last_used: Dict[Tuple[Platform, str], float] = field(default_factory=dict, repr=False)
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    MAX_COOLDOWN_ENTRIES = 1024  # 冷却记录超过此数量时清理已过期的记录
+
+    def __post_init__(self):
+        if not self.prefix or any(char.isspace() for char in self.prefix):
+            raise ValueError(f"Invalid command prefix: {self.prefix!r}")
+        for index, argument in enumerate(self.arguments):
+            if argument.greedy and index != len(self.arguments) - 1:
+                raise ValueError(f"Greedy argument {argument.name} must be the last one")
+            if not argument.optional and index and self.arguments[index - 1].optional:
+                raise ValueError(f"Required argument {argument.name} follows an optional one")
+
+    @property
+    def usage(self) -> str:
+        """用法说明，如 !!bind <name> [server]"""
+        return " ".join([self.prefix] + [argument.usage for argument in self.arguments])
+
+    def parse(self, text: str) -> Dict[str, Any]:
+        """按参数定义解析命令前缀之后的文本"""
+        args = {}
+        rest = text.strip()
+        for argument in self.arguments:
+            if not rest:
+                if not argument.optional:
+                    raise ArgumentError(f"Missing argument: {argument.name}")
+                args[argument.name] = argument.default
+                continue
+            if argument.greedy:
+                value, rest = rest, ""
+            else:
+                parts = rest.split(None, 1)
+                value, rest = parts[0], parts[1] if len(parts) > 1 else ""
+            try:
+                args[argument.name] = argument.type(value)
+            except ValueError:
+                raise ArgumentError(f"Invalid value for {argument.name}: {value}")
+        if rest:
+            raise ArgumentError(f"Unexpected argument: {rest.split(None, 1)[0]}")
+        return args
+
+    def check_cooldown(self, platform: Platform, user_id: str) -> bool:
+        """检查并记录冷却，冷却中返回 False"""
+        if self.cooldown <= 0:
+            return True
+        key = (platform, user_id)
+        now = time.monotonic()
+        with self.lock:
+            last = self.last_used.get(key)
+            if last is not None and now - last < self.cooldown:
+                return False
+            if len(self.last_used) >= self.MAX_COOLDOWN_ENTRIES:
+                self.last_used = {k: t for k, t in self.last_used.items() if now - t < self.cooldown}
+            self.last_used[key] = now
+        return True
+
+
+class _TrieNode:
+    __slots__ = ("children", "commands")
+
+    def __init__(self):
+        self.children: Dict[str, '_TrieNode'] = {}
+        self.commands: List[Command] = []  # 以此为前缀的命令，各自响应的平台互不重叠
+
+
+class CommandRouter:
+    """前缀命令路由
+
+    所有命令前缀存放在一棵字符前缀树中，每条消息从头扫描一遍即可找到最长的、
+    其后为空白或消息结尾的已注册前缀。非命令消息通常在第一个字符处即结束查找。
+    同一前缀可以为不同的平台分别注册命令。
+    """
+
+    def __init__(self, logger, sender: Callable[[SendMessageRequest], Any]):
+        """
+        Args:
+            logger: 日志记录器
+            sender: 发送回复的函数，接收 SendMessageRequest
+        """
+        self.logger = logger
+        self.sender = sender
+        self.root = _TrieNode()
+        self.commands: Dict[str, List[Command]] = {}
+        self.lock = threading.Lock()
+
+    def register(self, command: Command) -> Command:
+        """注册命令，前缀已被响应相同平台的命令注册时抛出 ValueError"""
+        with self.lock:
+            for registered in self.commands.get(command.prefix, ()):
+                if registered.platforms is None or command.platforms is None or registered.platforms & command.platforms:
+                    raise ValueError(f"Command {command.prefix} is already registered")
+            node = self.root
+            for char in command.prefix:
+                child = node.children.get(char)
+                if child is None:
+                    child = node.children[char] = _TrieNode()
+                node = child
+            node.commands.append(command)
+            self.commands.setdefault(command.prefix, []).append(command)
+        return command
+
+    def unregister(self, command: Command) -> bool:
+        """注销命令，返回命令是否已注册"""
+        with self.lock:
+            registered = self.commands.get(command.prefix, [])
+            if command not in registered:
+                return False
+            registered.remove(command)
+            if not registered:
+                del self.commands[command.prefix]
+            path = [self.root]
+            for char in command.prefix:
+                path.append(path[-1].children[char])
+            path[-1].commands.remove(command)
+            # 自下而上移除不再使用的节点
+            for depth in range(len(command.prefix), 0, -1):
+                if path[depth].children or path[depth].commands:
+                    break
+                del path[depth - 1].children[command.prefix[depth - 1]]
+        return True
+
+    def match(self, content: str, platform: Optional[Platform] = None) -> Optional[Tuple[Command, int]]:
+        """查找消息开头的命令
+
+        Args:
+            content: 消息内容
+            platform: 消息来源平台，只匹配响应该平台的命令，None 表示不限平台
+
+        Returns:
+            命令及前缀结束的位置，不是命令时返回 None
+        """
+        node = self.root
+        matched = None
+        for index, char in enumerate(content):
+            node = node.children.get(char)
+            if node is None:
+                break
+            if node.commands:
+                end = index + 1
+                if end == len(content) or content[end].isspace():
+                    for command in node.commands:
+                        if platform is None or command.platforms is None or platform in command.platforms:
+                            matched = (command, end)
+                            break
+        return matched
+
+    def route(self, platform: Platform, message: Message) -> bool:
+        """将消息交给匹配的命令处理
+
+        Returns:
+            消息是否为已注册的命令
+        """
+        matched = self.match(message.content, platform)
+        if matched is None:
+            return False
+        command, end = matched
+        if command.permission is not None and not command.permission(platform, message):
+            self.logger.debug(f"Permission denied for {command.prefix} from {platform}:{message.user.id}")
+            return True
+
+        text = message.content[end:]
+        if message.segment_parser is not None:
+            # 参数只取文本段，同时还原平台的转义
+            text = "".join(seg.data.get('text', '') for seg in message.segment_parser(text) if seg.type == 'text')
+        context = CommandContext(command, platform, message, {}, self.sender)
+        try:
+            context.args = command.parse(text)
+        except ArgumentError as e:
+            context.reply(f"{e}\nUsage: {command.usage}")
+            return True
+        # 参数错误的调用不计入冷却
+        if not command.check_cooldown(platform, message.user.id):
+            return True
+        try:
+            command.handler(context)
+        except Exception as e:
+            self.logger.error(f"Error handling command {command.prefix}: {e}")
+        return True
+
+    def __len__(self) -> int:
+        return sum(len(commands) for commands in self.commands.values())
+
+
+# 导出
+__all__ = [
+    "ArgumentError", "Argument", "Command", "CommandContext", "CommandHandler", "PermissionCheck", "CommandRouter"
+]
@@ -81,12 +81,20 @@ class Context:
             cls._instance.reset()
             cls._instance = None
     
+    def get_mcdr_work_dir(self) -> Path:
+        """获取MCDR工作目录"""
+        return Path(self.server.get_mcdr_config()['working_directory']).parent
+
+    def get_data_dir(self) -> Path:
+        """获取插件数据目录 (config/im_api)，不存在时自动创建"""
+        data_dir = self.get_mcdr_work_dir() / 'config' / 'im_api'
+        data_dir.mkdir(parents=True, exist_ok=True)
+        return data_dir
+
     def load_config(self) -> ImAPIConfig:
         """加载配置文件"""
         try:
-            # 获取MCDR工作目录
-            mcdr_work_dir = Path(self.server.get_mcdr_config()['working_directory']).parent
-            self.config = ImAPIConfig.load(mcdr_work_dir)
+            self.config = ImAPIConfig.load(self.get_mcdr_work_dir())
             self.logger.info("Configuration loaded successfully")
         except Exception as e:
             self.logger.error(f"Failed to load configuration: {e}")
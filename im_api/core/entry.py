@@ -1,19 +1,22 @@
 import os
 import json
-from typing import Any, Dict, Optional
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Union
 
 from mcdreforged.api.types import PluginServerInterface, CommandSource, Info
 from mcdreforged.api.command import Literal
 
 from im_api.config import ImAPIConfig
 from im_api.core.driver import DriverManager
-from im_api.core.processor import EventProcessor
-from im_api.core.bridge import MessageBridge
+from im_api.core.command import Argument, Command, CommandHandler, PermissionCheck
+from im_api.core.processor import EventProcessor, Subscription, SubscriptionCallback
+from im_api.core.bridge import MessageBridge, SendCallback
 from im_api.core.context import Context
 from im_api.drivers.qq import QQDriver
 from im_api.drivers.base import Platform
 from im_api.drivers.tg import TeleGramDriver
 from im_api.drivers.matrix import MatrixDriver
+from im_api.models.request import ChannelInfo, SendMessageRequest, SendResult
 
 class ImAPI:
     """ImAPI 插件主类"""
@@ -72,13 +75,95 @@ class ImAPI:
     def unload(self):
         """卸载插件"""
         self.logger.info("Unloading ImAPI...")
-        # 先关闭所有驱动
+        # 先停止分发和发送，再关闭所有驱动
+        self.event_processor.shutdown()
+        self.message_bridge.shutdown()
         self.driver_manager.shutdown()
         # 等待一段时间确保资源被释放
         import time
         time.sleep(1)
         self.logger.info("ImAPI unloaded successfully")
 
+    def send_message(self, request: SendMessageRequest, callback: Optional[SendCallback] = None,
+                     timeout: Optional[float] = None) -> 'Future[Dict[Platform, SendResult]]':
+        """发送消息，立即返回，可在 MCDR 的任意线程中调用
+
+        Args:
+            request: 发送消息请求
+            callback: 发送完成后以各平台结果调用，不应阻塞
+            timeout: 总时限（秒），超时的平台结果为 TIMEOUT
+
+        Returns:
+            结果为各平台发送结果的 Future
+        """
+        return self.message_bridge.submit(request, callback, timeout)
+
+    def send_messages(self, requests: List[SendMessageRequest],
+                      callback: Optional[Callable[[List[Dict[Platform, SendResult]]], None]] = None,
+                      timeout: Optional[float] = None) -> 'Future[List[Dict[Platform, SendResult]]]':
+        """批量发送消息，立即返回
+
+        请求按平台分组，每个驱动一次性并发发送自己的全部请求。
+
+        Returns:
+            结果为与请求一一对应的各平台发送结果列表的 Future
+        """
+        return self.message_bridge.submit_batch(requests, callback, timeout)
+
+    def multicast(self, content: str, channels: List[ChannelInfo], platforms: Optional[Set[Union[Platform, str]]] = None,
+                  callback: Optional[Callable[[List[Dict[Platform, SendResult]]], None]] = None,
+                  timeout: Optional[float] = None) -> 'Future[List[Dict[Platform, SendResult]]]':
+        """将同一内容发送到多个频道，立即返回
+
+        Returns:
+            结果为与频道一一对应的各平台发送结果列表的 Future
+        """
+        return self.message_bridge.multicast(content, channels, platforms, callback, timeout)
+
+    async def send_message_async(self, request: SendMessageRequest,
+                                 timeout: Optional[float] = None) -> Dict[Platform, SendResult]:
+        """在协程中发送消息并等待各平台的结果"""
+        return await self.message_bridge.send_async(request, timeout)
+
+    def subscribe_messages(self, callback: SubscriptionCallback,
+                           platforms: Optional[Iterable[Union[Platform, str]]] = None,
+                           channels: Optional[Iterable[str]] = None,
+                           users: Optional[Iterable[str]] = None) -> Subscription:
+        """订阅满足条件的消息，只有匹配的消息才会调用回调
+
+        回调以 (平台, 消息) 在分发线程中调用，插件卸载时应调用 unsubscribe。
+        """
+        return self.event_processor.subscribe_messages(callback, platforms, channels, users)
+
+    def subscribe_events(self, callback: SubscriptionCallback,
+                         event_types: Optional[Iterable[str]] = None,
+                         platforms: Optional[Iterable[Union[Platform, str]]] = None,
+                         channels: Optional[Iterable[str]] = None,
+                         users: Optional[Iterable[str]] = None) -> Subscription:
+        """订阅满足条件的事件，只有匹配的事件才会调用回调
+
+        回调以 (平台, 事件) 在分发线程中调用，插件卸载时应调用 unsubscribe。
+        """
+        return self.event_processor.subscribe_events(callback, event_types, platforms, channels, users)
+
+    def unsubscribe(self, subscription: Subscription) -> bool:
+        """取消订阅"""
+        return self.event_processor.unsubscribe(subscription)
+
+    def register_command(self, prefix: str, handler: CommandHandler, arguments: Optional[List[Argument]] = None,
+                         cooldown: float = 0, permission: Optional[PermissionCheck] = None,
+                         platforms: Optional[Iterable[Union[Platform, str]]] = None, description: str = "") -> Command:
+        """注册前缀命令，如 !!online
+
+        所有命令共用一棵前缀树，每条消息只查找一次；参数不符合定义时自动回复用法。
+        处理函数以 CommandContext 在分发线程中调用，插件卸载时应调用 unregister_command。
+        """
+        return self.event_processor.register_command(prefix, handler, arguments, cooldown, permission, platforms, description)
+
+    def unregister_command(self, command: Command) -> bool:
+        """注销命令"""
+        return self.event_processor.unregister_command(command)
+
     # def reload(self, source: CommandSource):
     #     """重载插件"""
     #     self.logger.info("Reloading ImAPI...")
@@ -99,8 +184,11 @@ class ImAPI:
 
         status = ["ImAPI Status:"]
         for driver in drivers:
-            status.append(
-                f"- {driver.get_platform()}: {'Connected' if driver.connected else 'Disconnected'}")
+            status.append(f"- {driver.get_platform()}: {driver.get_status()}")
+        status.append(f"- inbound: {self.event_processor.get_status()}")
+        spool = self.message_bridge.spool
+        if spool is not None:
+            status.append(f"- spool: {spool.depth()} messages waiting to be resent")
         source.reply("\n".join(status))
 
 
@@ -120,6 +208,8 @@ def on_load(server: PluginServerInterface, old_module):
     # 创建新实例并加载
     api = ImAPI(server)
     if not api.load():
+        # 构造时已启动的发送、分发线程和出站日志需要一并关闭
+        api.unload()
         return server.unload_plugin(ImAPI.PLUGIN_ID)
     context.set_api(api)  # 加载完成后再设置到 Context 中
     
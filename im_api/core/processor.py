@@ -1,16 +1,250 @@
-from typing import Any, Dict, Optional, Union
+import itertools
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Any, Callable, Deque, Dict, FrozenSet, Hashable, Iterable, List, Optional, Tuple, Union
 
 from mcdreforged.api.all import *
 
+from im_api.config import InboundConfig, OverflowPolicy
 from im_api.core.driver import DriverManager
 from im_api.core.bridge import MessageBridge
+from im_api.core.command import Argument, Command, CommandHandler, CommandRouter, PermissionCheck
 from im_api.core.context import Context
 from im_api.models.message import Event, Message
 from im_api.drivers.base import Platform, BaseDriver
 
 
+class DispatchShard:
+    """单个分发线程的有界队列"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.items: Deque[Callable[[], None]] = deque()
+        self.lock = threading.Lock()
+        self.not_empty = threading.Condition(self.lock)
+        self.not_full = threading.Condition(self.lock)
+        self.dropped = 0
+        self.dispatched = 0
+
+
+class InboundDispatcher:
+    """入站事件分发队列
+
+    驱动在自己的事件循环中调用 put，只做入队，不等待插件代码；
+    分发线程每次取出一批事件依次分发。事件按键（平台与频道）分配到固定的分发线程，
+    同一频道的事件保持顺序。
+    """
+
+    WARN_INTERVAL = 10  # 丢弃事件时警告日志的最短间隔（秒）
+
+    def __init__(self, config: InboundConfig, logger):
+        self.config = config
+        self.logger = logger
+        self.shards = [DispatchShard(config.queue_size) for _ in range(max(1, config.workers))]
+        self.stopping = False
+        self.last_warning = 0.0
+        self.threads = [
+            threading.Thread(target=self.run, args=(shard,), name=f"ImAPI-Dispatcher-{index}", daemon=True)
+            for index, shard in enumerate(self.shards)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def put(self, key: Hashable, task: Callable[[], None]) -> bool:
+        """将分发任务入队
+
+        Args:
+            key: 分配分发线程的键，相同的键按入队顺序分发
+            task: 分发任务
+
+        Returns:
+            是否入队，队列已满且按策略丢弃新事件时返回 False
+        """
+        shard = self.shards[hash(key) % len(self.shards)]
+        policy = self.config.overflow
+        with shard.lock:
+            if self.stopping:
+                return False
+            if len(shard.items) >= shard.capacity:
+                if policy == OverflowPolicy.BLOCK:
+                    shard.not_full.wait_for(lambda: len(shard.items) < shard.capacity or self.stopping,
+                                            timeout=self.config.block_timeout)
+                if policy == OverflowPolicy.DROP_OLDEST:
+                    shard.items.popleft()
+                    self.on_drop(shard)
+                elif len(shard.items) >= shard.capacity or self.stopping:
+                    self.on_drop(shard)
+                    return False
+            shard.items.append(task)
+            shard.not_empty.notify()
+        return True
+
+    def on_drop(self, shard: DispatchShard) -> None:
+        """记录丢弃的事件，需持有队列锁"""
+        shard.dropped += 1
+        now = time.monotonic()
+        if now - self.last_warning >= self.WARN_INTERVAL:
+            self.last_warning = now
+            self.logger.warning(f"Inbound queue full ({self.config.overflow.value}), {self.get_dropped()} events dropped so far")
+
+    def run(self, shard: DispatchShard) -> None:
+        """分发线程，队列为空且已停止时退出"""
+        while True:
+            with shard.lock:
+                shard.not_empty.wait_for(lambda: shard.items or self.stopping)
+                if not shard.items:
+                    return
+                batch = [shard.items.popleft() for _ in range(min(self.config.batch_size, len(shard.items)))]
+                shard.not_full.notify_all()
+            for task in batch:
+                try:
+                    task()
+                except Exception as e:
+                    self.logger.error(f"Error dispatching inbound event: {e}")
+            with shard.lock:
+                shard.dispatched += len(batch)
+
+    def get_depth(self) -> int:
+        """队列中等待分发的事件数量"""
+        return sum(len(shard.items) for shard in self.shards)
+
+    def get_dropped(self) -> int:
+        """因队列已满而丢弃的事件数量"""
+        return sum(shard.dropped for shard in self.shards)
+
+    def get_dispatched(self) -> int:
+        """已分发的事件数量"""
+        return sum(shard.dispatched for shard in self.shards)
+
+    def stop(self, timeout: float = 1) -> None:
+        """停止接收新事件，在时限内分发完队列中剩余的事件"""
+        for shard in self.shards:
+            with shard.lock:
+                self.stopping = True
+                shard.not_empty.notify_all()
+                shard.not_full.notify_all()
+        deadline = time.monotonic() + timeout
+        for thread in self.threads:
+            thread.join(timeout=max(0, deadline - time.monotonic()))
+
+
+SubscriptionCallback = Callable[[Platform, Union[Message, Event]], None]
+
+_subscription_ids = itertools.count()
+
+
+@dataclass(eq=False)
+class Subscription:
+    """入站消息或事件的订阅
+
+    各选择器为 None 时不限制，否则只接收取值在集合内的消息或事件。
+    """
+    callback: SubscriptionCallback
+    platforms: Optional[FrozenSet[Platform]] = None  # 平台
+    channels: Optional[FrozenSet[str]] = None        # 频道ID
+    users: Optional[FrozenSet[str]] = None           # 用户ID
+    event_types: Optional[FrozenSet[str]] = None     # 事件类型，仅对事件订阅有效
+    id: int = field(default_factory=lambda: next(_subscription_ids))  # 注册顺序
+
+    def matches(self, platform: Platform, channel_id: Optional[str], user_id: Optional[str], event_type: Optional[str]) -> bool:
+        """检查消息或事件是否满足全部选择器"""
+        return (self.platforms is None or platform in self.platforms) and \
+            (self.channels is None or channel_id in self.channels) and \
+            (self.users is None or user_id in self.users) and \
+            (self.event_types is None or event_type in self.event_types)
+
+
+class SubscriptionIndex:
+    """订阅索引
+
+    每个订阅按最有区分度的选择器（频道 > 用户 > 事件类型 > 平台）登记到对应的哈希索引，
+    没有选择器的订阅作为通配。查找时只检查各索引命中的订阅，开销与匹配数量成正比。
+    索引在订阅变化时整体重建并替换，分发线程读取时无需加锁。
+    """
+
+    DIMENSIONS = ("channels", "users", "event_types", "platforms")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscriptions: List[Subscription] = []
+        # (各选择器的索引, 通配订阅)
+        self.snapshot: Tuple[Dict[str, Dict[Hashable, List[Subscription]]], List[Subscription]] = \
+            ({dimension: {} for dimension in self.DIMENSIONS}, [])
+
+    def add(self, subscription: Subscription) -> None:
+        """添加订阅"""
+        with self.lock:
+            self.subscriptions.append(subscription)
+            self.rebuild()
+
+    def remove(self, subscription: Subscription) -> bool:
+        """移除订阅，返回订阅是否存在"""
+        with self.lock:
+            if subscription not in self.subscriptions:
+                return False
+            self.subscriptions.remove(subscription)
+            self.rebuild()
+            return True
+
+    def rebuild(self) -> None:
+        """重建索引，需持有锁"""
+        indexes: Dict[str, Dict[Hashable, List[Subscription]]] = {dimension: {} for dimension in self.DIMENSIONS}
+        wildcard = []
+        for subscription in self.subscriptions:
+            for dimension in self.DIMENSIONS:
+                values = getattr(subscription, dimension)
+                if values is not None:
+                    for value in values:
+                        indexes[dimension].setdefault(value, []).append(subscription)
+                    break
+            else:
+                wildcard.append(subscription)
+        self.snapshot = (indexes, wildcard)
+
+    def match(self, platform: Platform, channel_id: Optional[str], user_id: Optional[str],
+              event_type: Optional[str] = None) -> List[Subscription]:
+        """查找匹配的订阅，按注册顺序返回"""
+        indexes, wildcard = self.snapshot
+        buckets = [
+            bucket for bucket in (
+                indexes["channels"].get(channel_id),
+                indexes["users"].get(user_id),
+                indexes["event_types"].get(event_type),
+                indexes["platforms"].get(platform),
+                wildcard
+            ) if bucket
+        ]
+        matched = [
+            subscription for bucket in buckets for subscription in bucket
+            if subscription.matches(platform, channel_id, user_id, event_type)
+        ]
+        if len(buckets) > 1:
+            matched.sort(key=lambda subscription: subscription.id)
+        return matched
+
+    def __len__(self) -> int:
+        return len(self.subscriptions)
+
+
+def _selector(values: Optional[Iterable[Any]], convert: Callable[[Any], Hashable] = str) -> Optional[FrozenSet]:
+    """将选择器参数转换为集合，None 表示不限制"""
+    return frozenset(convert(value) for value in values) if values is not None else None
+
+
+def _platform(value: Union[Platform, str]) -> Platform:
+    return Platform.from_string(value) if isinstance(value, str) else value
+
+
 class EventProcessor:
-    """事件处理器，负责处理所有事件"""
+    """事件处理器，负责处理所有事件
+
+    驱动回调只将事件放入入站队列，由分发线程调用 MCDR 的 dispatch_event，
+    下游插件处理缓慢时不会阻塞驱动的接收循环。分发时同时将消息和事件
+    直接交给匹配的订阅，以已注册前缀开头的消息交给命令路由。
+    """
 
     def __init__(self, server: ServerInterface, driver_manager: DriverManager, message_bridge: MessageBridge):
         """初始化事件处理器
@@ -24,29 +258,141 @@ class EventProcessor:
         self.driver_manager = driver_manager
         self.message_bridge = message_bridge
         self.logger = Context.get_instance().logger
+        config = Context.get_instance().config
+        self.dispatcher = InboundDispatcher(config.inbound if config is not None else InboundConfig(), self.logger)
+        self.message_subscriptions = SubscriptionIndex()
+        self.event_subscriptions = SubscriptionIndex()
+        self.commands = CommandRouter(self.logger, message_bridge.submit)
+
+    def register_command(self, prefix: str, handler: CommandHandler, arguments: Optional[List[Argument]] = None,
+                         cooldown: float = 0, permission: Optional[PermissionCheck] = None,
+                         platforms: Optional[Iterable[Union[Platform, str]]] = None, description: str = "") -> Command:
+        """注册前缀命令
+
+        Args:
+            prefix: 命令前缀，如 !!online，消息以前缀开头且其后为空白或结尾时触发
+            handler: 以 CommandContext 调用，在分发线程中执行，不应阻塞
+            arguments: 参数定义，参数不符合时自动回复用法
+            cooldown: 同一用户两次调用的最短间隔（秒）
+            permission: 以 (平台, 消息) 调用，返回 False 时忽略本次调用
+            platforms: 只响应这些平台，None 表示所有平台
+            description: 命令说明
+
+        Returns:
+            已注册的命令，用于 unregister_command
+        """
+        command = Command(prefix, handler, list(arguments or []), cooldown, permission,
+                          _selector(platforms, _platform), description)
+        return self.commands.register(command)
+
+    def unregister_command(self, command: Command) -> bool:
+        """注销命令，返回命令是否已注册"""
+        return self.commands.unregister(command)
+
+    def subscribe_messages(self, callback: SubscriptionCallback,
+                           platforms: Optional[Iterable[Union[Platform, str]]] = None,
+                           channels: Optional[Iterable[str]] = None,
+                           users: Optional[Iterable[str]] = None) -> Subscription:
+        """订阅满足条件的消息
+
+        Args:
+            callback: 以 (平台, 消息) 调用，在分发线程中执行，不应阻塞
+            platforms: 平台，None 表示所有平台
+            channels: 频道ID，None 表示所有频道
+            users: 发送者用户ID，None 表示所有用户
+
+        Returns:
+            订阅，用于 unsubscribe
+        """
+        subscription = Subscription(callback, _selector(platforms, _platform), _selector(channels), _selector(users))
+        self.message_subscriptions.add(subscription)
+        return subscription
+
+    def subscribe_events(self, callback: SubscriptionCallback,
+                         event_types: Optional[Iterable[str]] = None,
+                         platforms: Optional[Iterable[Union[Platform, str]]] = None,
+                         channels: Optional[Iterable[str]] = None,
+                         users: Optional[Iterable[str]] = None) -> Subscription:
+        """订阅满足条件的事件
+
+        Args:
+            callback: 以 (平台, 事件) 调用，在分发线程中执行，不应阻塞
+            event_types: 事件类型（如 guild.member.join），None 表示所有类型
+            platforms: 平台，None 表示所有平台
+            channels: 频道ID，None 表示所有频道
+            users: 相关用户ID，None 表示所有用户
+
+        Returns:
+            订阅，用于 unsubscribe
+        """
+        subscription = Subscription(callback, _selector(platforms, _platform), _selector(channels), _selector(users),
+                                    _selector(event_types))
+        self.event_subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> bool:
+        """取消订阅，返回订阅是否存在"""
+        return self.message_subscriptions.remove(subscription) or self.event_subscriptions.remove(subscription)
+
+    def deliver(self, subscriptions: List[Subscription], platform: Platform, item: Union[Message, Event]) -> None:
+        """调用匹配的订阅回调"""
+        for subscription in subscriptions:
+            try:
+                subscription.callback(platform, item)
+            except Exception as e:
+                self.logger.error(f"Error in subscription callback: {e}")
 
     def on_message(self, platform: Platform, message: Message):
-        """处理来自驱动的消息
+        """处理来自驱动的消息，入队后立即返回
 
         Args:
             platform: 平台标识
             message: 消息对象
         """
-        # 触发消息事件
-        self.logger.info(f"Received message from {platform}: {message.content}")
-        self.server.dispatch_event(LiteralEvent("im_api.message"), (platform, message))
+        self.dispatcher.put((platform, message.channel.id), partial(self.dispatch_message, platform, message))
 
     def on_event(self, platform: Platform, event: Event):
-        """处理来自驱动的事件
+        """处理来自驱动的事件，入队后立即返回
 
         Args:
             platform: 平台标识
             event: 事件对象
         """
-        # 触发事件
+        channel_id = event.channel.id if event.channel is not None else None
+        self.dispatcher.put((platform, channel_id), partial(self.dispatch_event, platform, event))
+
+    def dispatch_message(self, platform: Platform, message: Message):
+        """在分发线程中触发消息事件"""
+        self.logger.info(f"Received message from {platform}: {message.content}")
+        self.server.dispatch_event(LiteralEvent("im_api.message"), (platform, message))
+        if self.message_subscriptions:
+            matched = self.message_subscriptions.match(platform, message.channel.id, message.user.id)
+            self.deliver(matched, platform, message)
+        if self.commands:
+            self.commands.route(platform, message)
+
+    def dispatch_event(self, platform: Platform, event: Event):
+        """在分发线程中触发事件"""
         self.logger.info(f"Received event from {platform}: {event.type}")
         self.server.dispatch_event(LiteralEvent("im_api.event"), (platform, event))
+        if self.event_subscriptions:
+            matched = self.event_subscriptions.match(
+                platform,
+                event.channel.id if event.channel is not None else None,
+                event.user.id if event.user is not None else None,
+                event.type
+            )
+            self.deliver(matched, platform, event)
+
+    def get_status(self) -> str:
+        """获取入站队列状态描述"""
+        dispatcher = self.dispatcher
+        return f"{dispatcher.get_depth()} queued, {dispatcher.get_dispatched()} dispatched, {dispatcher.get_dropped()} dropped"
+
+    def shutdown(self) -> None:
+        """停止分发线程"""
+        self.dispatcher.stop()
 
 
 # 导出
-__all__ = ["EventProcessor"]
+__all__ = ["EventProcessor", "InboundDispatcher", "Subscription", "SubscriptionIndex", "SubscriptionCallback"]
@@ -0,0 +1,213 @@
+import json
+import sqlite3
+import threading
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import List, Optional, Set, Tuple
+
+from im_api.config import SpoolConfig
+from im_api.models import request as request_models
+from im_api.models.message import Segment
+from im_api.models.request import ChannelInfo, MessageType, SendMessageRequest
+
+
+def dump_request(request: SendMessageRequest) -> str:
+    """将发送请求序列化为 JSON，platforms 由日志条目单独记录"""
+    extra = request.extra
+    return json.dumps({
+        "channel": {"id": request.channel.id, "type": request.channel.type.value, "guild_id": request.channel.guild_id},
+        "content": request.content,
+        "extra": {"type": type(extra).__name__, "data": asdict(extra)} if extra is not None else None,
+        "raw_extra": request.raw_extra,
+        "segments": [[seg.type, seg.data] for seg in request.segments] if request.segments is not None else None
+    }, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+def load_request(data: str, platform: str) -> SendMessageRequest:
+    """还原 dump_request 序列化的发送请求，目标平台限定为日志条目所属的平台"""
+    data = json.loads(data)
+    channel = data["channel"]
+    extra = data.get("extra")
+    extra_cls = getattr(request_models, extra["type"], None) if extra else None
+    segments = data.get("segments")
+    return SendMessageRequest(
+        channel=ChannelInfo(id=channel["id"], type=MessageType(channel["type"]), guild_id=channel.get("guild_id")),
+        content=data["content"],
+        platforms={platform},
+        extra=extra_cls(**extra["data"]) if extra_cls is not None else None,
+        raw_extra=data.get("raw_extra") or {},
+        segments=[Segment(seg_type, seg_data) for seg_type, seg_data in segments] if segments is not None else None
+    )
+
+
+@dataclass
+class SpoolEntry:
+    """出站日志中等待重发的消息"""
+    id: int
+    platform: str
+    channel: str
+    request: SendMessageRequest
+    attempts: int
+
+
+class OutboundSpool:
+    """出站消息日志
+
+    基于 WAL 模式的 SQLite，保存在 config/im_api/spool.db。发送前先写入日志，
+    成功后删除；平台不可用或发送失败的消息标记为待重发，恢复连接后按写入顺序
+    逐频道重发。同一频道存在待重发消息时，新消息也排在其后写入日志，保证顺序。
+    插件重启时，上次未确认的消息全部视为待重发。
+    """
+
+    REPLAY_BATCH = 500  # 每次重发读取的最多消息数
+
+    def __init__(self, path: Path, config: SpoolConfig):
+        self.config = config
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None)
+        # auto_vacuum 只在建表前设置才生效，之后由 compact 回收空间
+        self.db.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS outbound ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, platform TEXT NOT NULL, channel TEXT NOT NULL, "
+            "request TEXT NOT NULL, created REAL NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, "
+            "queued INTEGER NOT NULL DEFAULT 0)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS outbound_queued ON outbound (platform, queued, id)")
+        # 上次运行中尚未确认的消息
+        self.db.execute("UPDATE outbound SET queued=1 WHERE queued=0")
+        self.size = self.db.execute("SELECT COUNT(*) FROM outbound").fetchone()[0]
+        self.pending: Set[Tuple[str, str]] = set()  # 存在待重发消息的 (平台, 频道)
+        self.closed = False
+        self.refresh()
+
+    def refresh(self, platform: Optional[str] = None) -> None:
+        """重新统计存在待重发消息的频道"""
+        with self.lock:
+            if platform is None:
+                rows = self.db.execute("SELECT DISTINCT platform, channel FROM outbound WHERE queued=1").fetchall()
+                self.pending = set(rows)
+            else:
+                rows = self.db.execute("SELECT DISTINCT channel FROM outbound WHERE platform=? AND queued=1", (platform,)).fetchall()
+                self.pending = {key for key in self.pending if key[0] != platform} | {(platform, channel) for channel, in rows}
+
+    def is_pending(self, platform: str, channel: str) -> bool:
+        """频道是否有待重发的消息"""
+        with self.lock:
+            return (platform, channel) in self.pending
+
+    def has_queued(self, platform: str) -> bool:
+        """平台是否有待重发的消息"""
+        with self.lock:
+            return any(key[0] == platform for key in self.pending)
+
+    def append(self, platform: str, request: SendMessageRequest, queued: bool) -> int:
+        """写入一条消息
+
+        Args:
+            platform: 目标平台
+            request: 发送请求
+            queued: True 表示直接等待重发，False 表示即将发送，需随后调用 ack 或 defer
+
+        Returns:
+            日志条目ID
+        """
+        with self.lock:
+            if self.size >= self.config.max_entries:
+                self._drop_oldest(self.size - self.config.max_entries + 1)
+            cursor = self.db.execute(
+                "INSERT INTO outbound (platform, channel, request, created, queued) VALUES (?, ?, ?, ?, ?)",
+                (platform, request.channel_id, dump_request(request), time.time(), int(queued))
+            )
+            self.size += 1
+            if queued:
+                self.pending.add((platform, request.channel_id))
+            return cursor.lastrowid
+
+    def ack(self, entry_id: int) -> None:
+        """消息发送成功，从日志中删除
+
+        关闭后完成的发送不再记录，条目在下次启动时重发。
+        """
+        with self.lock:
+            if self.closed:
+                return
+            self.size -= self.db.execute("DELETE FROM outbound WHERE id=?", (entry_id,)).rowcount
+
+    def defer(self, entry_id: int) -> bool:
+        """消息发送失败，标记为待重发
+
+        Returns:
+            是否仍会重发，超过 max_attempts 的消息被丢弃时返回 False
+        """
+        with self.lock:
+            if self.closed:
+                # 未确认的条目在下次启动时重发
+                return True
+            row = self.db.execute("SELECT platform, channel, attempts FROM outbound WHERE id=?", (entry_id,)).fetchone()
+            if row is None:
+                return False
+            platform, channel, attempts = row
+            if attempts + 1 >= self.config.max_attempts:
+                self.size -= self.db.execute("DELETE FROM outbound WHERE id=?", (entry_id,)).rowcount
+                return False
+            self.db.execute("UPDATE outbound SET attempts=?, queued=1 WHERE id=?", (attempts + 1, entry_id))
+            self.pending.add((platform, channel))
+            return True
+
+    def queued(self, platform: str) -> List[SpoolEntry]:
+        """按写入顺序读取平台的待重发消息，跳过已超过 max_age 的消息"""
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT id, channel, request, attempts FROM outbound "
+                "WHERE platform=? AND queued=1 AND created>=? ORDER BY id LIMIT ?",
+                (platform, time.time() - self.config.max_age, self.REPLAY_BATCH)
+            ).fetchall()
+        return [SpoolEntry(entry_id, platform, channel, load_request(data, platform), attempts)
+                for entry_id, channel, data, attempts in rows]
+
+    def depth(self, platform: Optional[str] = None) -> int:
+        """待重发的消息数量"""
+        with self.lock:
+            if platform is None:
+                return self.db.execute("SELECT COUNT(*) FROM outbound WHERE queued=1").fetchone()[0]
+            return self.db.execute("SELECT COUNT(*) FROM outbound WHERE platform=? AND queued=1", (platform,)).fetchone()[0]
+
+    def _drop_oldest(self, count: int) -> int:
+        cursor = self.db.execute(
+            "DELETE FROM outbound WHERE id IN (SELECT id FROM outbound WHERE queued=1 ORDER BY id LIMIT ?)", (count,)
+        )
+        self.size -= cursor.rowcount
+        return cursor.rowcount
+
+    def compact(self) -> int:
+        """丢弃超过 max_age 和 max_entries 的待重发消息，回收文件空间
+
+        Returns:
+            丢弃的消息数量
+        """
+        with self.lock:
+            dropped = self.db.execute(
+                "DELETE FROM outbound WHERE queued=1 AND created<?", (time.time() - self.config.max_age,)
+            ).rowcount
+            self.size -= dropped
+            if self.size > self.config.max_entries:
+                dropped += self._drop_oldest(self.size - self.config.max_entries)
+            self.db.execute("PRAGMA incremental_vacuum")
+            self.db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        if dropped:
+            self.refresh()
+        return dropped
+
+    def close(self) -> None:
+        """关闭数据库，未确认的消息在下次启动时重发"""
+        with self.lock:
+            self.closed = True
+            self.db.close()
+
+
+# 导出
+__all__ = ["OutboundSpool", "SpoolEntry", "dump_request", "load_request"]
@@ -1,18 +1,153 @@
+import asyncio
+import random
+import uuid
 from abc import ABC, abstractmethod
-from typing import Any, Callable, Dict, Optional, Union
+from collections import deque
+from concurrent.futures import Future, wait
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Any, Callable, Deque, Dict, Hashable, List, Optional, Union
 
 from im_api.core.context import Context
 from im_api.models.message import Event, Message
 from im_api.models.request import SendMessageRequest
 from im_api.models.platform import Platform
 
+class DriverState(Enum):
+    """驱动连接状态"""
+    DISCONNECTED = "disconnected"
+    CONNECTING = "connecting"
+    CONNECTED = "connected"
+    RECONNECTING = "reconnecting"
+
+
+class Backoff:
+    """带随机抖动的指数退避"""
+
+    def __init__(self, base_delay: float = 1, max_delay: float = 60):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.failures = 0
+
+    def reset(self) -> None:
+        """连接恢复后重置"""
+        self.failures = 0
+
+    def next_delay(self) -> float:
+        """记录一次失败并返回下次重试前的等待时间（秒）"""
+        self.failures += 1
+        delay = min(self.max_delay, self.base_delay * 2 ** (self.failures - 1))
+        return random.uniform(delay / 2, delay)
+
+
+class PermanentSendError(Exception):
+    """发送请求本身无效（如频道ID错误、被平台拒绝），重试也不会成功"""
+    pass
+
+
+@dataclass
+class OutboundMessage:
+    """出站队列中待发送的消息"""
+    key: Hashable           # 会话、房间等，同一键的消息按顺序发送
+    payload: Any            # 平台相关的消息内容
+    future: asyncio.Future
+    tx_id: str = field(default_factory=lambda: uuid.uuid4().hex)  # 重试时保持不变，可用于幂等发送
+
+
+class OutboundQueue:
+    """按键排序的出站消息队列
+
+    每个键（会话、房间等）一个有序队列和一个发送协程，不同键之间并发发送。
+    子类实现 _send 完成单条消息的发送，失败后可调用 backoff 按指数退避重试。
+    所有方法都需在驱动所在的事件循环中调用。
+    """
+
+    def __init__(self, max_retries: int = 5, base_delay: float = 1, max_delay: float = 60):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._queues: Dict[Hashable, Deque[OutboundMessage]] = {}
+        self._workers: Dict[Hashable, asyncio.Task] = {}
+        # 统计数据
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.throttled = 0
+
+    def depth(self, key: Optional[Hashable] = None) -> int:
+        """获取队列中（含发送中）的消息数量"""
+        if key is not None:
+            return len(self._queues.get(key, ()))
+        return sum(len(queue) for queue in list(self._queues.values()))
+
+    async def send(self, key: Hashable, payload: Any) -> str:
+        """将消息加入队列并等待发送完成
+
+        Returns:
+            消息ID
+        """
+        message = OutboundMessage(key, payload, asyncio.get_running_loop().create_future())
+        self._queues.setdefault(key, deque()).append(message)
+        if key not in self._workers:
+            self._workers[key] = asyncio.create_task(self._worker(key))
+        return await asyncio.shield(message.future)
+
+    async def _worker(self, key: Hashable) -> None:
+        queue = self._queues[key]
+        try:
+            while queue:
+                message = queue[0]
+                try:
+                    message_id = await self._send(message)
+                    self.sent += 1
+                    if not message.future.done():
+                        message.future.set_result(message_id)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    self.failed += 1
+                    if not message.future.done():
+                        message.future.set_exception(e)
+                queue.popleft()
+        finally:
+            self._workers.pop(key, None)
+            if not queue:
+                self._queues.pop(key, None)
+
+    async def _send(self, message: OutboundMessage) -> str:
+        """发送单条消息并返回消息ID，由子类实现"""
+        raise NotImplementedError()
+
+    async def backoff(self, attempt: int, error: Any) -> None:
+        """第 attempt 次失败后等待重试，超过最大重试次数时抛出异常"""
+        if attempt > self.max_retries:
+            raise RuntimeError(f"Giving up after {self.max_retries} retries: {error}")
+        self.retried += 1
+        await asyncio.sleep(min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    def close(self, reason: str = "Driver disconnected") -> None:
+        """取消所有发送协程，未发送的消息以异常结束"""
+        for worker in list(self._workers.values()):
+            worker.cancel()
+        for queue in self._queues.values():
+            for message in queue:
+                if not message.future.done():
+                    message.future.set_exception(RuntimeError(reason))
+                    message.future.exception()
+        self._queues.clear()
+
+
 class BaseDriver(ABC):
     """驱动基类，定义了驱动的基本接口"""
+
+    SEND_WAIT = 5  # send_messages 等待已提交消息完成的最长时间（秒）
     
     def __init__(self, config: Dict[str, Any]):
         """初始化驱动"""
         self.config = config
         self.connected = False
+        self.state = DriverState.DISCONNECTED
+        self.last_error: Optional[str] = None
         self.message_callback: Optional[Callable[[str, Message], None]] = None
         self.event_callback: Optional[Callable[[str, Event], None]] = None
         self.logger = Context.get_instance().logger
@@ -38,6 +173,60 @@ class BaseDriver(ABC):
             消息ID, 如果发送失败则返回 None
         """
         pass
+
+    def submit_messages(self, requests: List[SendMessageRequest]) -> List['Future[Optional[str]]']:
+        """提交发送请求，驱动可覆盖此方法以并发发送而不阻塞调用方
+
+        默认实现依次调用 send_message，返回时所有 Future 均已完成。
+
+        Args:
+            requests: 发送消息请求列表
+
+        Returns:
+            与请求一一对应的 Future，结果为消息ID，发送失败时为 None 或以异常结束，
+            请求本身无效时以 PermanentSendError 结束
+        """
+        futures = []
+        for request in requests:
+            future: Future = Future()
+            try:
+                future.set_result(self.send_message(request))
+            except Exception as e:
+                future.set_exception(e)
+            futures.append(future)
+        return futures
+
+    def send_messages(self, requests: List[SendMessageRequest]) -> List[Optional[str]]:
+        """批量发送消息，最多等待 SEND_WAIT 秒
+
+        Args:
+            requests: 发送消息请求列表
+
+        Returns:
+            与请求一一对应的消息ID，发送失败或仍未完成的为 None
+        """
+        futures = self.submit_messages(requests)
+        done, _ = wait(futures, timeout=self.SEND_WAIT)
+        results: List[Optional[str]] = [None] * len(requests)
+        for index, future in enumerate(futures):
+            if future not in done:
+                self.logger.warning(f"Message to {requests[index].channel_id} is still queued")
+                continue
+            try:
+                results[index] = future.result()
+            except Exception as e:
+                self.logger.error(f"Error sending message: {e}")
+        return results
+
+    @staticmethod
+    def failed_futures(count: int, error: Exception) -> List['Future[Optional[str]]']:
+        """生成以异常结束的 Future，用于驱动未连接等无法提交的情况"""
+        futures = []
+        for _ in range(count):
+            future: Future = Future()
+            future.set_exception(error)
+            futures.append(future)
+        return futures
         
     def register_callbacks(self, message_callback: Callable[[str, Message], None], event_callback: Callable[[str, Event], None]):
         """注册回调函数"""
@@ -45,10 +234,18 @@ class BaseDriver(ABC):
         self.event_callback = event_callback
         self.logger.debug(f"Registered callbacks for {self.get_platform()} driver")
 
+    def is_ready(self) -> bool:
+        """是否可以立即发送消息，为 False 时发送请求会写入出站日志等待重发"""
+        return self.connected and self.state != DriverState.RECONNECTING
+
+    def get_status(self) -> str:
+        """获取驱动状态描述，用于 !!im status"""
+        return 'Connected' if self.connected else 'Disconnected'
+
     @classmethod
     def get_platform(cls) -> Union[Platform, str]:
         """Return the platform identifier"""
         raise NotImplementedError()
 
 # 导出
-__all__ = ["Platform", "BaseDriver"]
+__all__ = ["Platform", "BaseDriver", "DriverState", "Backoff", "PermanentSendError", "OutboundMessage", "OutboundQueue"]
@@ -1,18 +1,338 @@
 import asyncio
+import hmac
+import json
 import logging
+import os
+import re
+import threading
+import time
 
-from typing import Optional
-from nio import AsyncClient, SyncError, SyncResponse, MatrixRoom, RoomMessageText
+from collections import OrderedDict
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Union
+from aiohttp import ClientError, web
+from nio import Api, AsyncClient, AsyncClientConfig, Event as MatrixEvent, SyncError, SyncResponse, MatrixRoom, RoomMessageText, RoomSendResponse, RoomMemberEvent, RoomGetStateResponse, ProfileGetResponse, UploadFilterResponse
 from mcdreforged.api.decorator import new_thread
 
 from im_api.models.request import SendMessageRequest
 from im_api.models.message import Message, Channel, User
 from im_api.models.platform import Platform
-from im_api.drivers import BaseDriver
-from im_api.config import MatrixConfig
+from im_api.drivers.base import BaseDriver, Backoff, DriverState, OutboundMessage, OutboundQueue, PermanentSendError
+from im_api.config import MatrixConfig, MatrixMode, MatrixAppServiceConfig
+from im_api.core.context import Context
 
 logging.getLogger('nio').setLevel(logging.WARNING)
 
+# 驱动维护房间名称和成员资料所需的状态事件
+STATE_EVENT_TYPES = [
+    "m.room.create",
+    "m.room.member",
+    "m.room.name",
+    "m.room.canonical_alias",
+    "m.room.topic",
+    "m.room.avatar",
+    "m.room.encryption",
+]
+# 驱动实际处理的时间线事件
+TIMELINE_EVENT_TYPES = ["m.room.message", *STATE_EVENT_TYPES]
+
+Profile = Tuple[Optional[str], Optional[str]]  # (显示名称, 头像 mxc URL)
+
+
+class ProfileCache:
+    """Matrix 用户资料缓存 (LRU + TTL)
+
+    优先使用 nio 已同步的房间成员状态，缺失时才请求服务器；
+    同一用户的并发查询只会发起一次请求。
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 3600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, Profile]]" = OrderedDict()
+        self._pending: Dict[str, asyncio.Future] = {}
+
+    def put(self, user_id: str, profile: Profile) -> None:
+        """写入缓存"""
+        self._entries[user_id] = (time.monotonic() + self.ttl, profile)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def peek(self, user_id: str) -> Optional[Profile]:
+        """读取未过期的缓存项"""
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del self._entries[user_id]
+            return None
+        self._entries.move_to_end(user_id)
+        return entry[1]
+
+    def invalidate(self, user_id: str) -> None:
+        """使缓存项失效"""
+        self._entries.pop(user_id, None)
+
+    def clear(self) -> None:
+        """清空缓存"""
+        self._entries.clear()
+        self._pending.clear()
+
+    async def get(self, client: AsyncClient, user_id: str, room: Optional[MatrixRoom] = None) -> Profile:
+        """获取用户资料
+
+        Args:
+            client: 用于回源查询的客户端
+            user_id: 用户ID
+            room: 消息所在房间，用于从成员状态中填充缓存
+
+        Returns:
+            (显示名称, 头像 mxc URL)
+        """
+        profile = self.peek(user_id)
+        if profile is not None:
+            return profile
+
+        member = room.users.get(user_id) if room is not None else None
+        if member is not None and (member.display_name or member.avatar_url):
+            profile = (member.display_name, member.avatar_url)
+            self.put(user_id, profile)
+            return profile
+
+        pending = self._pending.get(user_id)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending[user_id] = future
+        try:
+            response = await client.get_profile(user_id)
+            if isinstance(response, ProfileGetResponse):
+                profile = (response.displayname, response.avatar_url)
+                self.put(user_id, profile)
+            else:
+                # 查询失败时不缓存，下次消息再重试
+                profile = (None, None)
+            future.set_result(profile)
+            return profile
+        except BaseException as e:
+            future.set_exception(e)
+            # 避免没有等待者时出现 "exception was never retrieved"
+            future.exception()
+            raise
+        finally:
+            self._pending.pop(user_id, None)
+
+
+class SyncStore:
+    """Matrix 同步进度与房间状态的本地存储
+
+    同步令牌每次同步后写入，房间状态仅在发生变化时写入，
+    两者分文件保存以避免每次同步都重写整个房间状态。
+    """
+
+    def __init__(self, path: Path):
+        path.mkdir(parents=True, exist_ok=True)
+        self.token_file = path / 'sync_token.json'
+        self.rooms_file = path / 'rooms.json'
+
+    @staticmethod
+    def _read(file: Path) -> Optional[Any]:
+        if not file.exists():
+            return None
+        with open(file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    @staticmethod
+    def _write(file: Path, data: Any) -> None:
+        # 先写临时文件再替换，避免中途退出导致文件损坏
+        tmp_file = file.with_suffix('.tmp')
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_file, file)
+
+    def load_token(self) -> Optional[str]:
+        """读取上次保存的同步令牌"""
+        data = self._read(self.token_file)
+        return data.get('next_batch') if data else None
+
+    def save_token(self, token: str) -> None:
+        """保存同步令牌"""
+        self._write(self.token_file, {'next_batch': token})
+
+    def load_rooms(self, own_user_id: str) -> Dict[str, MatrixRoom]:
+        """读取房间状态并还原为 nio 房间对象"""
+        rooms = {}
+        for room_id, data in (self._read(self.rooms_file) or {}).items():
+            room = MatrixRoom(room_id, own_user_id, data.get('encrypted', False))
+            room.name = data.get('name')
+            room.canonical_alias = data.get('canonical_alias')
+            room.topic = data.get('topic')
+            room.room_avatar_url = data.get('avatar_url')
+            for user_id, (display_name, avatar_url) in data.get('members', {}).items():
+                room.add_member(user_id, display_name, avatar_url)
+            rooms[room_id] = room
+        return rooms
+
+    def save_rooms(self, snapshot: Dict[str, Any]) -> None:
+        """保存 dump_rooms 生成的房间状态"""
+        self._write(self.rooms_file, snapshot)
+
+    @staticmethod
+    def dump_rooms(rooms: Dict[str, MatrixRoom]) -> Dict[str, Any]:
+        """生成房间状态快照，只保留驱动用到的字段"""
+        return {
+            room_id: {
+                'name': room.name,
+                'canonical_alias': room.canonical_alias,
+                'topic': room.topic,
+                'avatar_url': room.room_avatar_url,
+                'encrypted': room.encrypted,
+                'members': {
+                    user_id: [user.display_name, user.avatar_url]
+                    for user_id, user in room.users.items()
+                }
+            }
+            for room_id, room in rooms.items()
+        }
+
+    @staticmethod
+    def has_state_changes(response: SyncResponse) -> bool:
+        """判断同步响应中是否包含房间状态变化"""
+        if response.rooms.invite or response.rooms.leave:
+            return True
+        for info in response.rooms.join.values():
+            if info.state:
+                return True
+            if any('state_key' in event.source for event in info.timeline.events):
+                return True
+        return False
+
+
+class MatrixOutboundQueue(OutboundQueue):
+    """Matrix 出站消息队列
+
+    遇到限流时按服务器返回的 retry_after_ms 等待，遇到 5xx 或网络错误时指数退避，
+    重试使用同一事务ID，因此不会重复发送。
+    """
+
+    def __init__(self, client: AsyncClient, max_retries: int = 5, base_delay: float = 1, max_delay: float = 60):
+        super().__init__(max_retries, base_delay, max_delay)
+        self.client = client
+
+    async def _send(self, message: OutboundMessage) -> str:
+        attempt = 0
+        while True:
+            try:
+                response = await self.client.room_send(
+                    room_id=message.key,
+                    message_type="m.room.message",
+                    content=message.payload,
+                    tx_id=message.tx_id
+                )
+            except (ClientError, asyncio.TimeoutError) as e:
+                error: Any = e
+            else:
+                if isinstance(response, RoomSendResponse):
+                    return str(response.event_id)
+                status = response.transport_response.status if response.transport_response else None
+                if response.status_code == "M_LIMIT_EXCEEDED" or status == 429:
+                    # 限流不计入重试次数
+                    self.throttled += 1
+                    await asyncio.sleep((response.retry_after_ms or 5000) / 1000)
+                    continue
+                if status is None:
+                    raise RuntimeError(str(response))
+                if status < 500:
+                    # 房间不存在、没有权限等
+                    raise PermanentSendError(str(response))
+                error = response
+
+            attempt += 1
+            await self.backoff(attempt, error)
+
+class AppServiceServer:
+    """Matrix 应用服务事务接收端
+
+    家服务器通过 PUT /_matrix/app/v1/transactions/{txnId} 推送事件，
+    同一事务可能因超时被重复推送，这里按事务ID去重。
+    """
+
+    def __init__(self, config: MatrixAppServiceConfig, handler: Callable[[List[Dict[str, Any]]], Awaitable[None]],
+                 max_seen: int = 1024):
+        self.host = config.host
+        self.port = config.port
+        self.hs_token = config.hs_token
+        self.handler = handler
+        self.max_seen = max_seen
+        self.logger = Context.get_instance().logger
+        self._seen: "OrderedDict[str, None]" = OrderedDict()
+
+        self.runner: Optional[web.AppRunner] = None
+        self.app = web.Application()
+        for prefix in ("/_matrix/app/v1", ""):  # 空前缀兼容旧版路径
+            self.app.router.add_put(f"{prefix}/transactions/{{txn_id}}", self.handle_transaction)
+            self.app.router.add_post(f"{prefix}/transactions/{{txn_id}}", self.handle_transaction)
+            self.app.router.add_get(f"{prefix}/users/{{user_id}}", self.handle_query)
+            self.app.router.add_get(f"{prefix}/rooms/{{alias}}", self.handle_query)
+        self.app.router.add_post("/_matrix/app/v1/ping", self.handle_ping)
+
+    def authorized(self, request: web.Request) -> bool:
+        """校验家服务器令牌，支持请求头和旧版 access_token 参数"""
+        auth = request.headers.get("Authorization", "")
+        token = auth[7:] if auth.startswith("Bearer ") else request.query.get("access_token", "")
+        return bool(self.hs_token) and hmac.compare_digest(token, self.hs_token)
+
+    @staticmethod
+    def forbidden() -> web.Response:
+        return web.json_response({"errcode": "M_FORBIDDEN", "error": "Bad hs_token"}, status=403)
+
+    async def handle_transaction(self, request: web.Request) -> web.Response:
+        """处理家服务器推送的事务"""
+        if not self.authorized(request):
+            return self.forbidden()
+        txn_id = request.match_info["txn_id"]
+        if txn_id in self._seen:
+            self.logger.debug(f"Skipping duplicated matrix transaction: {txn_id}")
+            return web.json_response({})
+        try:
+            body = await request.json()
+        except ValueError:
+            return web.json_response({"errcode": "M_NOT_JSON", "error": "Invalid JSON"}, status=400)
+        await self.handler(body.get("events", []))
+        self._seen[txn_id] = None
+        while len(self._seen) > self.max_seen:
+            self._seen.popitem(last=False)
+        return web.json_response({})
+
+    async def handle_query(self, request: web.Request) -> web.Response:
+        """不提供用户和房间别名的按需创建"""
+        if not self.authorized(request):
+            return self.forbidden()
+        return web.json_response({"errcode": "M_NOT_FOUND"}, status=404)
+
+    async def handle_ping(self, request: web.Request) -> web.Response:
+        if not self.authorized(request):
+            return self.forbidden()
+        return web.json_response({})
+
+    async def start(self) -> None:
+        """启动 HTTP 服务"""
+        self.runner = web.AppRunner(self.app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, self.host, self.port)
+        await site.start()
+        self.logger.info(f"Matrix appservice listening at http://{self.host}:{self.port}")
+
+    async def stop(self) -> None:
+        """停止 HTTP 服务"""
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+
 class MatrixDriver(BaseDriver):
     """Matrix 驱动实现"""
 
@@ -26,12 +346,250 @@ class MatrixDriver(BaseDriver):
         self.user_id = config.user_id
         self.token = config.token
         self.homeserver = config.homeserver
+        self.mode = config.mode
+        self.sync_config = config.sync
+        self.appservice_config = config.appservice
 
-        self.homeserver_online = True
         self.receiver = None
+        self.client: Optional[AsyncClient] = None  # 收发共用的长连接客户端
+        self.event_loop: Optional[asyncio.AbstractEventLoop] = None
+        self.startup_event = threading.Event()
+        self.profile_cache = ProfileCache()
+        self.outbound: Optional[MatrixOutboundQueue] = None
+        self.sync_store: Optional[SyncStore] = None
+        self.backlog_since = 0  # 早于该时间戳（毫秒）的消息不会转发
         
         self.logger.info(f"Initializing config for matrix driver...")
+
+    def create_client(self) -> AsyncClient:
+        """创建客户端实例，需在接收线程的事件循环中调用"""
+        # 限流和网络错误由出站队列和同步循环自行重试，便于统计和反映连接状态
+        client = AsyncClient(
+            homeserver=self.homeserver,
+            config=AsyncClientConfig(max_limit_exceeded=0, max_timeouts=0)
+        )
+        client.user_id = self.user_id
+        client.access_token = self.token
+        client.device_id = 'mcdr'
+        return client
+
+    def get_backlog_since(self, resumed: bool) -> int:
+        """根据补发策略计算消息转发的起始时间戳（毫秒）"""
+        now = int(time.time() * 1000)
+        if not resumed or self.sync_config.backlog == "none":
+            return now
+        if self.sync_config.backlog == "recent":
+            return now - self.sync_config.backlog_max_age * 1000
+        if self.sync_config.backlog != "all":
+            self.logger.warning(f"Unknown matrix backlog policy: {self.sync_config.backlog}, using 'none'")
+            return now
+        return 0
+
+    def build_sync_filter(self) -> Dict[str, Any]:
+        """根据配置生成服务端同步过滤器"""
+        room_filter: Dict[str, Any] = {
+            "state": {
+                "types": STATE_EVENT_TYPES,
+                "lazy_load_members": self.sync_config.lazy_load_members
+            },
+            "timeline": {
+                "types": TIMELINE_EVENT_TYPES,
+                "not_senders": [self.user_id],
+                "limit": self.sync_config.timeline_limit,
+                "lazy_load_members": self.sync_config.lazy_load_members
+            },
+            "ephemeral": {"not_types": ["*"]},
+            "account_data": {"not_types": ["*"]}
+        }
+        if self.sync_config.rooms:
+            room_filter["rooms"] = list(self.sync_config.rooms)
+        return {
+            "presence": {"not_types": ["*"]},
+            "account_data": {"not_types": ["*"]},
+            "room": room_filter
+        }
+
+    async def upload_sync_filter(self, client: AsyncClient) -> Union[str, Dict[str, Any]]:
+        """上传同步过滤器
+
+        Returns:
+            过滤器ID，上传失败时返回过滤器本身以内联方式使用
+        """
+        sync_filter = self.build_sync_filter()
+        response = await client.upload_filter(
+            presence=sync_filter["presence"],
+            account_data=sync_filter["account_data"],
+            room=sync_filter["room"]
+        )
+        if isinstance(response, UploadFilterResponse):
+            self.logger.debug(f"Uploaded matrix sync filter: {response.filter_id}")
+            return response.filter_id
+        self.logger.warning(f"Failed to upload matrix sync filter, using inline filter: {response}")
+        return sync_filter
+
+    def load_sync_store(self, client: AsyncClient) -> bool:
+        """从本地存储还原同步令牌和房间状态
+
+        Returns:
+            是否成功还原同步令牌
+        """
+        if not self.sync_config.persist:
+            return False
+        try:
+            store_dir = re.sub(r'[^\w.-]', '_', self.user_id or 'default')
+            self.sync_store = SyncStore(Context.get_instance().get_data_dir() / 'matrix' / store_dir)
+            token = self.sync_store.load_token()
+            if token is None:
+                return False
+            client.rooms.update(self.sync_store.load_rooms(self.user_id))
+            client.loaded_sync_token = token
+            self.logger.info(f"Resuming matrix sync with {len(client.rooms)} stored rooms")
+            return True
+        except Exception as e:
+            self.logger.error(f"Failed to load matrix sync store: {e}")
+            client.rooms.clear()
+            return False
         
+    async def on_member_event(self, room: MatrixRoom, event: RoomMemberEvent) -> None:
+        """成员事件回调，保持资料缓存与 m.room.member 一致"""
+        if event.membership == "join":
+            self.profile_cache.put(
+                event.state_key,
+                (event.content.get("displayname"), event.content.get("avatar_url"))
+            )
+        else:
+            self.profile_cache.invalidate(event.state_key)
+
+    async def on_text_message(self, room: MatrixRoom, event: RoomMessageText) -> None:
+        """文本消息回调"""
+        if event.server_timestamp < self.backlog_since:
+            return
+        if event.sender != self.user_id:
+            self.logger.debug(f"Message preview: [{room.display_name}] <{room.user_name(event.sender)}> {event.body}")
+            display_name, avatar_url = await self.profile_cache.get(self.client, event.sender, room)
+            message = Message(
+                id=event.event_id,
+                content=event.body,
+                channel=Channel(
+                    id=room.room_id,
+                    type="group",
+                    name=room.display_name
+                ),
+                user=User(
+                    id=event.sender,
+                    name=display_name,
+                    nick=room.user_name(event.sender),
+                    avatar=Api.mxc_to_http(avatar_url, self.homeserver) if avatar_url else None
+                ),
+                platform=Platform.MATRIX
+            )
+
+            if self.message_callback:
+                self.message_callback(Platform.MATRIX, message)
+
+    async def get_appservice_room(self, room_id: str) -> MatrixRoom:
+        """获取应用服务模式下的房间，首次出现时拉取一次房间状态"""
+        room = self.client.rooms.get(room_id)
+        if room is not None:
+            return room
+        room = MatrixRoom(room_id, self.user_id)
+        self.client.rooms[room_id] = room
+        response = await self.client.room_get_state(room_id)
+        if isinstance(response, RoomGetStateResponse):
+            for source in response.events:
+                self.apply_state_event(room, MatrixEvent.parse_event(source))
+        else:
+            self.logger.warning(f"Failed to get state of matrix room {room_id}: {response}")
+        return room
+
+    @staticmethod
+    def apply_state_event(room: MatrixRoom, event: MatrixEvent) -> None:
+        """将状态事件应用到房间对象"""
+        if isinstance(event, RoomMemberEvent):
+            room.handle_membership(event)
+        else:
+            room.handle_event(event)
+
+    async def on_appservice_events(self, events: List[Dict[str, Any]]) -> None:
+        """处理应用服务事务中的事件"""
+        for source in events:
+            room_id = source.get("room_id")
+            if not room_id:
+                continue
+            try:
+                room = await self.get_appservice_room(room_id)
+                event = MatrixEvent.parse_event(source)
+                if "state_key" in source:
+                    self.apply_state_event(room, event)
+                if isinstance(event, RoomMemberEvent):
+                    await self.on_member_event(room, event)
+                elif isinstance(event, RoomMessageText):
+                    await self.on_text_message(room, event)
+            except Exception as e:
+                self.logger.error(f"Error handling matrix appservice event {source.get('event_id')}: {e}")
+
+    async def sync_loop(self, client: AsyncClient) -> None:
+        """受监督的同步循环
+
+        同步或处理同步结果失败时按指数退避重试，并从上次成功的同步令牌继续，
+        因此家服务器短暂不可用只会延迟消息而不会丢失。
+        """
+        backoff = Backoff()
+        sync_filter = None
+        first_sync = True
+        while True:
+            try:
+                if sync_filter is None:
+                    sync_filter = await self.upload_sync_filter(client)
+                # 首次同步不等待新事件，尽快完成启动
+                response = await client.sync(timeout=0 if first_sync else 30000, sync_filter=sync_filter)
+                if isinstance(response, SyncResponse):
+                    if self.state != DriverState.CONNECTED:
+                        self.logger.info("Matrix sync connected")
+                    first_sync = False
+                    self.state = DriverState.CONNECTED
+                    self.last_error = None
+                    backoff.reset()
+                    await client.run_response_callbacks([response])
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # 任何错误都只结束本轮同步，退避后重试
+                response = e
+
+            if isinstance(response, SyncError) and response.status_code == "M_LIMIT_EXCEEDED":
+                await asyncio.sleep((response.retry_after_ms or 5000) / 1000)
+                continue
+
+            self.state = DriverState.RECONNECTING
+            self.last_error = str(response) or type(response).__name__
+            delay = backoff.next_delay()
+            self.logger.error(f"Sync error in matrix: {self.last_error}, retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    async def serve_appservice(self) -> None:
+        """受监督的应用服务接收端，启动失败时按指数退避重试"""
+        backoff = Backoff()
+        while True:
+            server = AppServiceServer(self.appservice_config, self.on_appservice_events)
+            try:
+                await server.start()
+                self.state = DriverState.CONNECTED
+                self.last_error = None
+                backoff.reset()
+                await asyncio.get_running_loop().create_future()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.state = DriverState.RECONNECTING
+                self.last_error = str(e)
+                delay = backoff.next_delay()
+                self.logger.error(f"Matrix appservice error: {e}, retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+            finally:
+                await server.stop()
+
     def connect(self) -> None:
         """和Matrix平台同步各种事件"""
         if self.connected:
@@ -39,79 +597,81 @@ class MatrixDriver(BaseDriver):
             return
 
         async def receive_messages() -> None:
-            # create client instance for receiver.
-            client = AsyncClient(homeserver=self.homeserver)
-            client.user_id = self.user_id
-            client.access_token = self.token
-            client.device_id = 'mcdr'
+            # the same client is reused by send_message, so its connection pool stays warm.
+            client = self.client
 
             async def on_sync_response(response: SyncResponse):
                 self.logger.debug(response)
-
-            def on_sync_error(response: SyncError):
-                self.logger.error(f"Sync error in matrix: {response.status_code}")
-                if response.status_code >= 500:
-                    self.homeserver_online = False
+                if self.sync_store is None:
+                    return
+                try:
+                    # 房间状态先于令牌写入，异常退出时最多重放少量状态事件
+                    if SyncStore.has_state_changes(response):
+                        snapshot = SyncStore.dump_rooms(client.rooms)
+                        await asyncio.get_running_loop().run_in_executor(None, self.sync_store.save_rooms, snapshot)
+                    self.sync_store.save_token(response.next_batch)
+                except Exception as e:
+                    self.logger.error(f"Failed to save matrix sync store: {e}")
 
             client.add_response_callback(on_sync_response, SyncResponse)
-            client.add_response_callback(on_sync_error, SyncError)
-
-            # text messages support.
-            async def message_callback(room: MatrixRoom, event: RoomMessageText) -> None:
-                if event.sender != self.user_id:
-                    self.logger.debug(f"Message preview: [{room.display_name}] <{room.user_name(event.sender)}> {event.body}")
-                    message = Message(
-                        id=event.event_id,
-                        content=event.body,
-                        channel=Channel(
-                            id=room.room_id,
-                            type="group",
-                            name=room.display_name
-                        ),
-                        user=User(
-                            id=event.sender,
-                            name=await client.get_displayname(event.sender),
-                            nick=room.user_name(event.sender),
-                            avatar=await client.get_avatar(event.sender)
-                        ),
-                        platform=Platform.MATRIX
-                    )
-
-                    if self.message_callback:
-                        self.message_callback(Platform.MATRIX, message)
-
-            if self.homeserver_online:
-                await client.sync(timeout=30000)
-                client.add_event_callback(message_callback, RoomMessageText)
+
+            if self.mode == MatrixMode.APPSERVICE:
+                # 家服务器会保留未确认的事务并在恢复后重新推送
+                self.backlog_since = self.get_backlog_since(True)
+                self.logger.info("Creating appservice receiver task...")
+                self.receiver = asyncio.create_task(self.serve_appservice())
+            else:
+                resumed = self.load_sync_store(client)
+                self.backlog_since = self.get_backlog_since(resumed)
+                client.add_event_callback(self.on_member_event, RoomMemberEvent)
+                client.add_event_callback(self.on_text_message, RoomMessageText)
                 self.logger.info("Creating receiver task...")
-                self.receiver = asyncio.create_task(client.sync_forever(timeout=30000))
-                try:
-                    await self.receiver
-                except asyncio.CancelledError:
-                    self.logger.warning('Receiver task has been cancelled!')
-                except Exception as e:
-                    self.logger.error(f"Receiver sync error: {e}", "Receiver")
-                    if isinstance(self.receiver, asyncio.Task):
-                        self.logger.error("Cancelling receiver task...")
-                        self.receiver.cancel()
-                finally:
-                    if isinstance(self.receiver, asyncio.Task):
-                        self.logger.error("Cancelling receiver task...")
-                        self.receiver.cancel()
-                    if client is not None:
-                        self.logger.error("Cancelling receiver client...")
-                        await client.close()
-            
+                self.receiver = asyncio.create_task(self.sync_loop(client))
+            try:
+                await self.receiver
+            except asyncio.CancelledError:
+                self.logger.warning('Receiver task has been cancelled!')
+            except Exception as e:
+                self.logger.error(f"Receiver sync error: {e}")
+            finally:
+                if isinstance(self.receiver, asyncio.Task):
+                    self.receiver.cancel()
+
         async def add_sync_task():
             self.logger.debug("Starting receiver event loop...")
-            await receive_messages()
+            self.event_loop = asyncio.get_running_loop()
+            self.client = self.create_client()
+            self.outbound = MatrixOutboundQueue(self.client)
+            self.state = DriverState.CONNECTING
+            self.startup_event.set()
+            try:
+                await receive_messages()
+            finally:
+                client, self.client = self.client, None
+                self.outbound.close("Matrix driver disconnected")
+                self.outbound = None
+                self.event_loop = None
+                self.connected = False
+                self.state = DriverState.DISCONNECTED
+                self.profile_cache.clear()
+                if client is not None:
+                    self.logger.info("Closing matrix client...")
+                    await client.close()
 
         @new_thread('ImAPI: MatrixReceiver')
         def run_sync_task():
             self.logger.info("Starting receiver task...")
-            asyncio.run(add_sync_task())
+            try:
+                asyncio.run(add_sync_task())
+            finally:
+                self.startup_event.set()
         
+        self.startup_event.clear()
         run_sync_task()
+        self.startup_event.wait(timeout=5)
+        if self.client is None:
+            self.logger.error("Failed to connect matrix driver: receiver loop not started")
+            return
         self.connected = True
         
     def disconnect(self) -> None:
@@ -119,10 +679,14 @@ class MatrixDriver(BaseDriver):
         if not self.connected:
             return
 
-        if isinstance(self.receiver, asyncio.Task):
-            self.logger.info("Disconnecting matrix driver...")
-            self.receiver.cancel()
-            self.connected = False
+        self.logger.info("Disconnecting matrix driver...")
+        if isinstance(self.receiver, asyncio.Task) and self.event_loop is not None:
+            try:
+                # 任务属于接收线程的事件循环，需线程安全地取消
+                self.event_loop.call_soon_threadsafe(self.receiver.cancel)
+            except RuntimeError:
+                pass
+        self.connected = False
         
     def send_message(self, request: SendMessageRequest) -> Optional[str]:
         """发送消息
@@ -133,28 +697,40 @@ class MatrixDriver(BaseDriver):
         Returns:
             消息ID, 如果发送失败则返回 None
         """
-        if not self.connected:
+        return self.send_messages([request])[0]
+
+    def submit_messages(self, requests: List[SendMessageRequest]) -> List['Future[Optional[str]]']:
+        """提交到接收线程的事件循环，经出站队列按房间顺序发送，相同内容只构造一次"""
+        outbound, loop = self.outbound, self.event_loop
+        if not self.connected or outbound is None or loop is None:
             self.logger.error("Cannot send message: driver not connected")
-            return None
-        async def _send_message():
-            # create client instance for reporter.
-            client = AsyncClient(homeserver=self.homeserver)
-            client.user_id = self.user_id
-            client.access_token = self.token
-            client.device_id = 'mcdr'
-            send_resp = await client.room_send(
-                room_id=request.channel_id,
-                message_type="m.room.message",
-                content={"msgtype": "m.text", "body": request.content},
-            )
-            await client.close()
-            return send_resp
-        try:
-            response = asyncio.run(_send_message())
-            return str(response.event_id)
-        except Exception as e:
-            self.logger.error(f"Error sending message: {e}")
-            return None
+            return self.failed_futures(len(requests), RuntimeError("Driver not connected"))
+        contents: Dict[str, Dict[str, Any]] = {}
+        futures = []
+        for request in requests:
+            content = contents.get(request.content)
+            if content is None:
+                content = contents[request.content] = {"msgtype": "m.text", "body": request.content}
+            futures.append(asyncio.run_coroutine_threadsafe(outbound.send(request.channel_id, content), loop))
+        return futures
+
+    def get_status(self) -> str:
+        """获取驱动状态描述"""
+        status = self.state.value.capitalize()
+        depth = self.get_queue_depth()
+        if depth:
+            status += f", {depth} messages queued"
+        if self.state == DriverState.RECONNECTING and self.last_error:
+            status += f" (last error: {self.last_error})"
+        return status
+
+    def get_queue_depth(self, room_id: Optional[str] = None) -> int:
+        """获取出站队列中待发送的消息数量
+
+        Args:
+            room_id: 房间ID，为 None 时返回所有房间的总数
+        """
+        return self.outbound.depth(room_id) if self.outbound is not None else 0
 
 # 导出
 __all__ = ["Platform", "MatrixDriver"]
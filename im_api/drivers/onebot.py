@@ -0,0 +1,251 @@
+import re
+import time
+from enum import Enum
+from typing import Any, Callable, Dict, Iterable, List, Optional, Union
+
+from im_api.models.message import Message, Event, User, Channel, Segment
+from im_api.models.platform import Platform
+
+# 优先使用更快的 JSON 库
+try:
+    import orjson
+
+    loads: Callable[[str], Any] = orjson.loads
+    JSON_BACKEND = "orjson"
+except ImportError:
+    import json
+
+    loads = json.loads
+    JSON_BACKEND = "json"
+
+
+class FrameType(Enum):
+    """OneBot WebSocket 帧类型"""
+    EVENT = "event"        # 消息、通知等需要处理的事件
+    META = "meta"          # 心跳、生命周期等元事件
+    RESPONSE = "response"  # API 调用的响应
+
+
+# JSON 字符串值中的引号必定被转义，因此这些带引号的键名只会以键的形式出现
+_ECHO_KEY = '"echo"'
+_META_KEY = '"meta_event_type"'
+_POST_TYPE_KEY = '"post_type"'
+
+
+def classify_frame(raw: str) -> FrameType:
+    """在解析 JSON 之前判断帧类型
+
+    只做子串查找，心跳等元事件无需完整解析即可丢弃。
+    """
+    if _ECHO_KEY in raw:
+        return FrameType.RESPONSE
+    if _META_KEY in raw:
+        return FrameType.META
+    if _POST_TYPE_KEY in raw:
+        return FrameType.EVENT
+    return FrameType.RESPONSE
+
+
+_CQ_CODE = re.compile(r"\[CQ:([^,\]]+)((?:,[^,=\]]+=[^,\]]*)*),?\]")
+_REPLY_CODE = re.compile(r"\[CQ:reply,(?:[^\]]*,)?id=(-?\d+)")
+
+
+def escape(text: str, in_param: bool = False) -> str:
+    """转义 CQ 码中的特殊字符"""
+    text = text.replace("&", "&amp;").replace("[", "&#91;").replace("]", "&#93;")
+    return text.replace(",", "&#44;") if in_param else text
+
+
+def unescape(text: str) -> str:
+    """还原转义的 CQ 码特殊字符"""
+    return text.replace("&#44;", ",").replace("&#91;", "[").replace("&#93;", "]").replace("&amp;", "&")
+
+
+def parse_segments(content: str) -> List[Segment]:
+    """将 CQ 码字符串解析为消息段列表"""
+    segments = []
+    position = 0
+    for match in _CQ_CODE.finditer(content):
+        if match.start() > position:
+            segments.append(Segment.text(unescape(content[position:match.start()])))
+        data = {}
+        for param in match.group(2).split(",")[1:]:
+            key, _, value = param.partition("=")
+            data[key] = unescape(value)
+        segments.append(Segment(match.group(1), data))
+        position = match.end()
+    if position < len(content):
+        segments.append(Segment.text(unescape(content[position:])))
+    return segments
+
+
+def encode_segments(segments: Iterable[Union[Segment, Dict[str, Any]]]) -> str:
+    """将消息段编码为 CQ 码字符串，支持 Segment 和 OneBot 数组格式"""
+    parts = []
+    for seg in segments:
+        seg_type, data = (seg.type, seg.data) if isinstance(seg, Segment) else (seg["type"], seg.get("data") or {})
+        if seg_type == "text":
+            parts.append(escape(str(data.get("text", ""))))
+        else:
+            params = "".join(f",{key}={escape(str(value), True)}" for key, value in data.items())
+            parts.append(f"[CQ:{seg_type}{params}]")
+    return "".join(parts)
+
+
+class GroupDirectory:
+    """群与群成员名称索引
+
+    连接建立时通过 get_group_list 批量加载群名，群成员列表在群首次活跃时加载，
+    之后由消息中的 sender 信息和通知事件增量更新，构造消息时无需逐条调用 API。
+    """
+
+    RETRY_INTERVAL = 60  # 成员列表加载失败后的重试间隔（秒）
+
+    def __init__(self):
+        self.groups: Dict[str, str] = {}  # 群号 -> 群名
+        self.members: Dict[str, Dict[str, Dict[str, str]]] = {}  # 群号 -> QQ号 -> 成员信息
+        self.member_requests: Dict[str, float] = {}  # 群号 -> 最近一次请求成员列表的时间
+
+    def load_groups(self, groups: List[Dict[str, Any]]):
+        """载入 get_group_list 的结果"""
+        for group in groups:
+            self.groups[str(group["group_id"])] = group.get("group_name", "")
+
+    def load_members(self, group_id: str, members: List[Dict[str, Any]]):
+        """载入 get_group_member_list 的结果，替换该群已有的成员索引"""
+        self.members[group_id] = {
+            str(member["user_id"]): {"nickname": member.get("nickname", ""), "card": member.get("card", "")}
+            for member in members
+        }
+
+    def needs_members(self, group_id: str) -> bool:
+        """判断是否需要加载群成员列表，返回 True 时视为已发起请求"""
+        if group_id in self.members:
+            return False
+        now = time.monotonic()
+        requested_at = self.member_requests.get(group_id)
+        if requested_at is not None and now - requested_at < self.RETRY_INTERVAL:
+            return False
+        self.member_requests[group_id] = now
+        return True
+
+    def update_member(self, group_id: str, user_id: str, **info: str):
+        """更新单个成员的信息，群成员列表尚未加载时忽略"""
+        members = self.members.get(group_id)
+        if members is not None:
+            members.setdefault(user_id, {"nickname": "", "card": ""}).update(info)
+
+    def remove_member(self, group_id: str, user_id: str):
+        """移除群成员"""
+        members = self.members.get(group_id)
+        if members is not None:
+            members.pop(user_id, None)
+
+    def remove_group(self, group_id: str):
+        """移除群及其成员索引"""
+        self.groups.pop(group_id, None)
+        self.members.pop(group_id, None)
+        self.member_requests.pop(group_id, None)
+
+    def group_name(self, group_id: str) -> Optional[str]:
+        """获取群名"""
+        return self.groups.get(group_id)
+
+    def member(self, group_id: str, user_id: str) -> Optional[Dict[str, str]]:
+        """获取群成员信息"""
+        members = self.members.get(group_id)
+        return members.get(user_id) if members is not None else None
+
+    def clear(self):
+        """清空索引"""
+        self.groups.clear()
+        self.members.clear()
+        self.member_requests.clear()
+
+
+def build_message(data: Dict[str, Any], directory: Optional[GroupDirectory] = None) -> Message:
+    """由消息事件构造消息对象
+
+    内容统一为 CQ 码字符串，消息段在首次访问时才解析。
+
+    Args:
+        data: 消息事件
+        directory: 群名与群名片的索引，用于补全频道和用户名称
+    """
+    user_id = data.get("user_id")
+    group_id = data.get("group_id")
+    sender = data.get("sender") or {}
+    content = data.get("message")
+    if isinstance(content, list):
+        # 数组格式上报
+        content = encode_segments(content)
+    reply = _REPLY_CODE.match(content) if content.startswith("[CQ:reply,") else None
+    group_name = data.get("group_name")
+    nick = sender.get("card") or None
+    if directory is not None and group_id:
+        group_name = group_name or directory.group_name(str(group_id))
+        member = directory.member(str(group_id), str(user_id))
+        nick = nick or (member and member["card"]) or None
+    return Message(
+        id=str(data.get("message_id")),
+        content=content,
+        channel=Channel(
+            id=str(group_id) if group_id else str(user_id),
+            type="group" if group_id else "private",
+            name=group_name
+        ),
+        user=User(
+            id=str(user_id),
+            name=sender.get("nickname", ""),
+            nick=nick,
+            avatar=f"http://q1.qlogo.cn/g?b=qq&nk={user_id}&s=640"
+        ),
+        platform=Platform.QQ,
+        reply_to=reply.group(1) if reply else None,
+        segment_parser=parse_segments
+    )
+
+
+# 通知类型到事件类型的映射
+NOTICE_EVENT_TYPES = {
+    "group_increase": "guild.member.join",
+    "group_decrease": "guild.member.leave",
+}
+
+
+def build_event(data: Dict[str, Any], directory: Optional[GroupDirectory] = None) -> Optional[Event]:
+    """由通知事件构造事件对象，不支持的通知类型返回 None
+
+    Args:
+        data: 通知事件
+        directory: 群名与群成员的索引，用于补全频道和用户名称
+    """
+    event_type = NOTICE_EVENT_TYPES.get(data.get("notice_type"))
+    if event_type is None:
+        return None
+    group_id = str(data.get("group_id"))
+    user_id = str(data.get("user_id"))
+    member = directory.member(group_id, user_id) if directory is not None else None
+    return Event(
+        id=str(data.get("time")),
+        type=event_type,
+        platform=Platform.QQ,
+        channel=Channel(
+            id=group_id,
+            type="group",
+            name=directory.group_name(group_id) if directory is not None else None
+        ),
+        user=User(
+            id=user_id,
+            name=member["nickname"] or None if member else None,
+            nick=member["card"] or None if member else None
+        )
+    )
+
+
+# 导出
+__all__ = [
+    "FrameType", "JSON_BACKEND", "loads", "classify_frame",
+    "escape", "unescape", "parse_segments", "encode_segments",
+    "GroupDirectory", "build_message", "build_event"
+]
@@ -1,20 +1,27 @@
 import asyncio
-import json
+import hashlib
+import hmac
+import itertools
 import threading
-from typing import Any, Optional, Literal
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Literal, Tuple
 
-from aiohttp import web, ClientSession, ClientWebSocketResponse
-from aiocqhttp import CQHttp, Event as CQEvent
+from aiohttp import web, ClientError, ClientSession, ClientTimeout, ClientWebSocketResponse, TCPConnector
+from aiocqhttp.exceptions import ActionFailed, ApiNotAvailable, NetworkError
 from mcdreforged.api.all import *
 
-from im_api.config import ConnectionType, QQConfig, WsClientConfig, WSServerConfig
-from im_api.drivers.base import BaseDriver, Platform
-from im_api.models.message import Message, Event, User, Channel
+from im_api.config import ConnectionType, QQConfig
+from im_api.drivers.base import BaseDriver, Backoff, DriverState, PermanentSendError, Platform
+from im_api.drivers.onebot import FrameType, GroupDirectory, build_event, build_message, classify_frame, encode_segments, loads
 from im_api.models.request import SendMessageRequest, MessageType
 
 
 class QQDriver(BaseDriver):
-    """QQ 驱动实现，支持正向和反向 WebSocket 连接"""
+    """QQ 驱动实现，支持正向和反向 WebSocket 以及 HTTP 连接"""
+
+    API_TIMEOUT = 5  # OneBot API 调用超时时间（秒）
+    SEND_WAIT = API_TIMEOUT + 1
+    READY_TIMEOUT = 4  # 正向 WebSocket 启动时等待首次握手的时间（秒）
     
     @classmethod
     def get_platform(cls) -> Platform:
@@ -29,18 +36,22 @@ class QQDriver(BaseDriver):
             self.port = config.server.port
             self.access_token = config.server.access_token
             self.url_prefix = config.server.url_prefix  # 移除末尾的斜杠
+        elif self.connection_type == ConnectionType.HTTP:
+            self.api_url = config.http.api_url.rstrip("/")
+            self.access_token = config.http.access_token
+            self.max_connections = config.http.max_connections
+            self.host = config.http.host
+            self.port = config.http.port
+            self.webhook_path = config.http.path
+            self.secret = config.http.secret
         else:
-            self.ws_url = config.client.ws_url
+            # 可配置多个地址，按顺序故障切换
+            self.ws_urls = [config.client.ws_url] if isinstance(config.client.ws_url, str) else list(config.client.ws_url)
             self.access_token = config.client.access_token
             self.heartbeat = config.client.heartbeat
         
         self.logger.info(f"Initializing QQ driver with connection_type={self.connection_type}")
         
-        # 创建 bot 实例
-        self.bot = CQHttp(
-            api_root=None,  # 不使用 HTTP API
-            access_token=self.access_token
-        )
         self.event_loop = None
         self.server_thread = None
         
@@ -49,23 +60,31 @@ class QQDriver(BaseDriver):
         self.runner = None
         self.site = None
         
+        # HTTP 相关
+        self.http_session: Optional[ClientSession] = None
+
         # 正向 WebSocket 相关
         self.ws_client: Optional[ClientWebSocketResponse] = None
         self.client_session: Optional[ClientSession] = None
-        self.reconnect_task = None
-        self.ws_heartbeat_task = None
+        self.reconnect_task: Optional[asyncio.Task] = None
+        self.ws_ready: Optional[asyncio.Event] = None
         
         self.startup_event = threading.Event()
         self.ws_connections = {}  # 存储所有 WebSocket 连接及其锁
         self.ws_locks = {}  # WebSocket 连接的锁
-
-        # 注册事件处理器
-        self.bot.on_message(self.handle_msg)
-        self.bot.on_notice(self.handle_notice)
+        self.ws_routes: Dict[Optional[str], List[int]] = {}  # 按 self_id 索引可调用 API 的连接
+        self.channel_accounts: Dict[Tuple[str, str], str] = {}  # 频道最近一次收到消息的账号
+        self.route_seq = itertools.count()
+        self.pending_calls: Dict[str, asyncio.Future] = {}  # 按 echo 等待响应的 API 调用
+        self.echo_seq = itertools.count()
+        self.directory = GroupDirectory()  # 群名与群成员名称索引
+        self.directory_tasks = set()  # 正在加载索引的后台任务
             
         async def handle_ws(request):
             """处理 WebSocket 连接"""
-            self.logger.info("New WebSocket connection")
+            self_id = request.headers.get("X-Self-ID")
+            role = request.headers.get("X-Client-Role", "Universal")
+            self.logger.info(f"New WebSocket connection: self_id={self_id}, role={role}")
             ws = web.WebSocketResponse()
             await ws.prepare(request)
             
@@ -73,25 +92,17 @@ class QQDriver(BaseDriver):
             ws_id = id(ws)
             self.ws_connections[ws_id] = ws
             self.ws_locks[ws_id] = asyncio.Lock()
+            # Event 角色的连接只推送事件，不能用于调用 API
+            api_capable = role.lower() != "event"
+            if api_capable:
+                self.ws_routes.setdefault(self_id, []).append(ws_id)
+                self.spawn_directory_task(self.preload_directory(self_id))
             
             try:
                 async for msg in ws:
                     if msg.type == web.WSMsgType.TEXT:
                         try:
-                            data = json.loads(msg.data)
-                            # 忽略心跳消息和响应消息
-                            if data.get("meta_event_type") == "lifecycle" or \
-                               data.get("meta_event_type") == "heartbeat" or \
-                               data.get("status") == "ok":  # 忽略响应消息
-                                continue
-                                
-                            self.logger.info(f"Received WebSocket message: {data}")
-                            # 创建事件对象并处理
-                            event = CQEvent.from_payload(data)
-                            if event.type == "message":
-                                await self.handle_msg(event)
-                            elif event.type == "notice":
-                                await self.handle_notice(event)
+                            await self.handle_frame(msg.data)
                         except Exception as e:
                             self.logger.error(f"Error handling WebSocket message: {e}")
                     elif msg.type == web.WSMsgType.ERROR:
@@ -100,34 +111,201 @@ class QQDriver(BaseDriver):
                 # 清理连接和锁
                 del self.ws_connections[ws_id]
                 del self.ws_locks[ws_id]
+                if api_capable:
+                    self.ws_routes[self_id].remove(ws_id)
+                    if not self.ws_routes[self_id]:
+                        del self.ws_routes[self_id]
                 self.logger.info("WebSocket connection closed")
                 return ws
             
         # 只在初始化时注册一次路由
         if(self.connection_type == ConnectionType.WS_SERVER):
             self.app.router.add_get(f"{self.url_prefix}", handle_ws)  # 使用配置的URL前缀
+        elif self.connection_type == ConnectionType.HTTP:
+            self.app.router.add_post(self.webhook_path, self.handle_webhook)
         else:
             self.app.router.add_get("/", handle_ws)
 
-    async def handle_msg(self, event: CQEvent):
+    async def handle_webhook(self, request: web.Request) -> web.Response:
+        """处理 HTTP 事件上报
+
+        请求体可以是单个事件，也可以是事件数组以批量上报。
+        配置了 secret 时校验 X-Signature 中的 HMAC-SHA1 签名。
+        """
+        body = await request.read()
+        if self.secret:
+            expected = "sha1=" + hmac.new(self.secret.encode(), body, hashlib.sha1).hexdigest()
+            if not hmac.compare_digest(request.headers.get("X-Signature", ""), expected):
+                self.logger.warning(f"Rejected webhook request with invalid signature from {request.remote}")
+                return web.Response(status=403)
+        try:
+            data = loads(body)
+        except ValueError:
+            return web.Response(status=400)
+        for event in data if isinstance(data, list) else [data]:
+            try:
+                await self.handle_event(event)
+            except Exception as e:
+                self.logger.error(f"Error handling webhook event: {e}")
+        # 不使用快速操作
+        return web.Response(status=204)
+
+    async def handle_frame(self, raw: str):
+        """处理一帧 WebSocket 数据"""
+        frame_type = classify_frame(raw)
+        # 忽略心跳和生命周期事件，无需解析
+        if frame_type == FrameType.META:
+            return
+        data = loads(raw)
+        # API 响应，按 echo 交给等待中的调用
+        if frame_type == FrameType.RESPONSE:
+            self.handle_api_response(data)
+            return
+        await self.handle_event(data)
+
+    async def handle_event(self, data: dict):
+        """按上报类型分发事件"""
+        post_type = data.get("post_type")
+        if post_type == "message":
+            # 记录频道所属账号，回复时使用同一账号
+            if "self_id" in data:
+                channel = ("group", str(data["group_id"])) if data.get("group_id") else ("private", str(data.get("user_id")))
+                self.channel_accounts[channel] = str(data["self_id"])
+            await self.handle_msg(data)
+        elif post_type == "notice":
+            await self.handle_notice(data)
+
+    def handle_api_response(self, data: dict):
+        """处理 API 响应"""
+        future = self.pending_calls.get(str(data.get("echo")))
+        if future is None or future.done():
+            self.logger.debug(f"Dropping unmatched API response: {data}")
+            return
+        # retcode 1 表示已异步处理，同样视为成功
+        if data.get("status") == "failed" or data.get("retcode") not in (0, 1):
+            future.set_exception(ActionFailed(data))
+        else:
+            future.set_result(data.get("data"))
+
+    async def call_api(self, action: str, params: Optional[dict] = None, timeout: float = API_TIMEOUT,
+                       self_id: Optional[str] = None, strict: bool = False) -> Any:
+        """调用 OneBot API 并等待响应，需在驱动的事件循环中调用
+
+        多个调用可同时进行，WebSocket 模式下通过 echo 字段匹配各自的响应，
+        HTTP 模式下直接请求 HTTP API。
+
+        Args:
+            action: API 名称
+            params: API 参数
+            timeout: 等待响应的超时时间（秒）
+            self_id: 反向 WebSocket 模式下调用 API 的账号，为 None 时使用任意账号
+            strict: 为 True 时只使用 self_id 的连接，该账号没有连接时调用失败
+
+        Returns:
+            响应中的 data 字段
+
+        Raises:
+            ApiNotAvailable: 没有可用的 WebSocket 连接
+            NetworkError: 等待响应超时
+            ActionFailed: OneBot 执行失败
+        """
+        if self.connection_type == ConnectionType.HTTP:
+            return await self.call_http_api(action, params, timeout)
+        echo = str(next(self.echo_seq))
+        future = asyncio.get_running_loop().create_future()
+        self.pending_calls[echo] = future
+        try:
+            if not await self.send_ws_message({"action": action, "params": params or {}, "echo": echo}, self_id, strict):
+                raise ApiNotAvailable()
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            raise NetworkError(f"API call {action} timed out")
+        finally:
+            self.pending_calls.pop(echo, None)
+
+    def spawn_directory_task(self, coro):
+        """在后台运行索引加载任务，并保留引用直到完成"""
+        task = asyncio.create_task(coro)
+        self.directory_tasks.add(task)
+        task.add_done_callback(self.directory_tasks.discard)
+
+    async def preload_directory(self, self_id: Optional[str] = None):
+        """连接建立后批量加载群列表"""
+        try:
+            groups = await self.call_api("get_group_list", self_id=self_id)
+        except Exception as e:
+            self.logger.warning(f"Failed to preload group list: {e}")
+            return
+        self.directory.load_groups(groups or [])
+        self.logger.debug(f"Loaded {len(groups or [])} groups for account {self_id}")
+
+    async def load_group_members(self, group_id: str, self_id: Optional[str] = None):
+        """加载群成员列表"""
+        try:
+            members = await self.call_api("get_group_member_list", {"group_id": int(group_id)}, self_id=self_id)
+        except Exception as e:
+            self.logger.warning(f"Failed to load member list of group {group_id}: {e}")
+            return
+        self.directory.load_members(group_id, members or [])
+        self.logger.debug(f"Loaded {len(members or [])} members of group {group_id}")
+
+    def update_directory(self, data: dict):
+        """根据消息和通知事件增量更新群成员索引"""
+        if not data.get("group_id"):
+            return
+        group_id = str(data["group_id"])
+        user_id = str(data.get("user_id"))
+        self_id = str(data["self_id"]) if "self_id" in data else None
+        post_type = data.get("post_type")
+        if post_type == "message":
+            # 群首次活跃时加载成员列表，此后以消息中的发送者信息保持更新
+            if self.directory.needs_members(group_id):
+                self.spawn_directory_task(self.load_group_members(group_id, self_id))
+            sender = data.get("sender") or {}
+            self.directory.update_member(group_id, user_id,
+                                         **{key: sender[key] for key in ("nickname", "card") if key in sender})
+            return
+        notice_type = data.get("notice_type")
+        if notice_type == "group_increase":
+            if user_id == self_id:
+                # 机器人加入新群，重新加载群列表以获取群名
+                self.spawn_directory_task(self.preload_directory(self_id))
+            else:
+                self.directory.update_member(group_id, user_id)
+        elif notice_type == "group_decrease":
+            if user_id == self_id or data.get("sub_type") == "kick_me":
+                self.directory.remove_group(group_id)
+            else:
+                self.directory.remove_member(group_id, user_id)
+        elif notice_type == "group_card":
+            self.directory.update_member(group_id, user_id, card=data.get("card_new", ""))
+
+    async def call_http_api(self, action: str, params: Optional[dict], timeout: float) -> Any:
+        """通过 HTTP 调用 OneBot API
+
+        所有调用共用一个保持连接的会话，并发连接数由连接池限制。
+        """
+        if self.http_session is None or self.http_session.closed:
+            raise ApiNotAvailable()
+        try:
+            async with self.http_session.post(f"{self.api_url}/{action}", json=params or {},
+                                              timeout=ClientTimeout(total=timeout)) as resp:
+                if resp.status != 200:
+                    raise NetworkError(f"API call {action} failed with HTTP {resp.status}")
+                data = await resp.json(loads=loads, content_type=None)
+        except asyncio.TimeoutError:
+            raise NetworkError(f"API call {action} timed out")
+        except ClientError as e:
+            raise NetworkError(f"API call {action} failed: {e}")
+        if data.get("status") == "failed" or data.get("retcode") not in (0, 1):
+            raise ActionFailed(data)
+        return data.get("data")
+
+    async def handle_msg(self, data: dict):
         """处理消息事件"""
-        self.logger.debug(f"Received message: {event.message} from {event.user_id}")
+        self.update_directory(data)
         # 转换为 Satori 消息格式
-        message = Message(
-            id=str(event.message_id),
-            content=event.message,
-            channel=Channel(
-                id=str(event.group_id) if event.group_id else str(event.user_id),
-                type="group" if event.group_id else "private",
-                name=event.group_name if hasattr(event, 'group_name') else None
-            ),
-            user=User(
-                id=str(event.user_id),
-                name=event.sender.get("nickname", ""),
-                avatar=f"http://q1.qlogo.cn/g?b=qq&nk={event.user_id}&s=640"
-            ),
-            platform=Platform.QQ
-        )
+        message = build_message(data, self.directory)
         self.logger.debug(f"Received message: {message.content} from {message.user.id} in {message.channel.id}")
         # 触发消息事件
         if self.message_callback:
@@ -136,38 +314,14 @@ class QQDriver(BaseDriver):
         else:
             self.logger.warning("No message callback registered")
 
-    async def handle_notice(self, event: CQEvent):
+    async def handle_notice(self, data: dict):
         """处理通知事件"""
-        self.logger.info(f"Received notice: {event.notice_type} from {event.user_id}")
-        # 转换为 Satori 事件格式
-        if event.notice_type == "group_increase":
-            evt = Event(
-                id=str(event.time),
-                type="guild.member.join",
-                platform=Platform.QQ,
-                channel=Channel(
-                    id=str(event.group_id),
-                    type="group"
-                ),
-                user=User(
-                    id=str(event.user_id)
-                )
-            )
-        elif event.notice_type == "group_decrease":
-            evt = Event(
-                id=str(event.time),
-                type="guild.member.leave",
-                platform=Platform.QQ,
-                channel=Channel(
-                    id=str(event.group_id),
-                    type="group"
-                ),
-                user=User(
-                    id=str(event.user_id)
-                )
-            )
-        else:
-            self.logger.debug(f"Ignoring unsupported notice type: {event.notice_type}")
+        self.logger.info(f"Received notice: {data.get('notice_type')} from {data.get('user_id')}")
+        # 转换为 Satori 事件格式，需在更新索引前构造以保留离开成员的名称
+        evt = build_event(data, self.directory)
+        self.update_directory(data)
+        if evt is None:
+            self.logger.debug(f"Ignoring unsupported notice type: {data.get('notice_type')}")
             return
             
         # 触发事件
@@ -187,11 +341,13 @@ class QQDriver(BaseDriver):
             try:
                 if self.connection_type == ConnectionType.WS_SERVER:
                     await self.start_ws_server()
+                elif self.connection_type == ConnectionType.HTTP:
+                    await self.start_http()
                 else:
                     await self.start_ws_client()
                 self.startup_event.set()
             except Exception as e:
-                self.logger.error(f"Failed to start {self.connection_type} WebSocket: {e}")
+                self.logger.error(f"Failed to start {self.connection_type.value} connection: {e}")
                 self.startup_event.set()
 
         def run_server():
@@ -208,16 +364,33 @@ class QQDriver(BaseDriver):
         self.server_thread.start()
         
         self.startup_event.wait(timeout=5)
-        if (self.connection_type == ConnectionType.WS_SERVER and self.site is not None) or \
-           (self.connection_type == ConnectionType.WS_CLIENT and self.ws_client is not None):
+        # 正向 WebSocket 在后台持续重连，握手未完成时同样视为已启动
+        if (self.connection_type in (ConnectionType.WS_SERVER, ConnectionType.HTTP) and self.site is not None) or \
+           (self.connection_type == ConnectionType.WS_CLIENT and self.reconnect_task is not None):
             self.connected = True
-            self.logger.info(f"QQ driver connected successfully using {self.connection_type} WebSocket")
+            self.logger.info(f"QQ driver connected successfully using {self.connection_type.value}")
         else:
-            self.logger.error(f"Failed to connect QQ driver: {self.connection_type} WebSocket not started")
+            self.logger.error(f"Failed to connect QQ driver: {self.connection_type.value} not started")
 
     async def cleanup(self):
         """清理资源"""
-        if self.connection_type == ConnectionType.WS_SERVER:
+        # 结束仍在等待响应的 API 调用
+        for future in self.pending_calls.values():
+            if not future.done():
+                future.cancel()
+        for task in list(self.directory_tasks):
+            task.cancel()
+        if self.connection_type == ConnectionType.HTTP:
+            try:
+                if self.site:
+                    await self.site.stop()
+                if self.runner:
+                    await self.runner.cleanup()
+                if self.http_session:
+                    await self.http_session.close()
+            except Exception as e:
+                self.logger.error(f"Error during HTTP cleanup: {e}")
+        elif self.connection_type == ConnectionType.WS_SERVER:
             try:
                 # 关闭所有 WebSocket 连接
                 for ws in set(self.ws_connections.values()):
@@ -274,21 +447,47 @@ class QQDriver(BaseDriver):
                 self.logger.error(f"Error during disconnect: {e}")
             
         self.connected = False
+        self.state = DriverState.DISCONNECTED
         self.event_loop = None
         self.server_thread = None
+        self.reconnect_task = None
+        self.directory.clear()
         self.site = None
         self.runner = None
         self.ws_client = None
         self.client_session = None
+        self.http_session = None
         self.app = web.Application()
         self.logger.info("QQ driver disconnected")
 
-    async def send_ws_message(self, data: dict) -> bool:
-        """发送 WebSocket 消息"""
+    def get_ws_candidates(self, self_id: Optional[str] = None, strict: bool = False) -> List[int]:
+        """获取可用于调用 API 的反向 WebSocket 连接，按轮询顺序排列
+
+        Args:
+            self_id: 指定账号，为 None 或该账号没有连接时使用任意账号
+            strict: 为 True 时只返回 self_id 的连接，用于调用方明确指定的账号
+        """
+        candidates = list(self.ws_routes.get(self_id, [])) if self_id is not None else []
+        if not candidates and not (strict and self_id is not None):
+            candidates = [ws_id for ws_ids in list(self.ws_routes.values()) for ws_id in ws_ids]
+        if len(candidates) > 1:
+            offset = next(self.route_seq) % len(candidates)
+            candidates = candidates[offset:] + candidates[:offset]
+        return candidates
+
+    async def send_ws_message(self, data: dict, self_id: Optional[str] = None, strict: bool = False) -> bool:
+        """发送 WebSocket 消息
+
+        Args:
+            data: 消息数据
+            self_id: 反向 WebSocket 模式下使用的账号
+            strict: 为 True 时不使用其他账号的连接
+        """
         if self.connection_type == ConnectionType.WS_SERVER:
-            # 使用反向 WebSocket 发送消息
-            for ws_id, ws in list(self.ws_connections.items()):
-                if ws.closed:
+            # 使用反向 WebSocket 发送消息，在同一账号的连接间轮询，失败时切换到下一个连接
+            for ws_id in self.get_ws_candidates(self_id, strict):
+                ws = self.ws_connections.get(ws_id)
+                if ws is None or ws.closed:
                     continue
                 try:
                     async with self.ws_locks[ws_id]:
@@ -320,42 +519,87 @@ class QQDriver(BaseDriver):
         Returns:
             消息ID, 如果发送失败则返回 None
         """
-        # 检查是否需要处理这个请求
-        if request.platforms is not None and Platform.QQ not in request.platforms:
-            return None
+        return self.send_messages([request])[0]
 
-        if not self.connected or not self.event_loop:
-            self.logger.error("Cannot send message: driver not connected")
-            return None
-            
-        # 构造消息
+    def build_send_call(self, request: SendMessageRequest, payloads: Dict[int, str]) -> Tuple[str, dict, Optional[str], bool]:
+        """构造发送消息的 API 调用
+
+        Args:
+            request: 发送消息请求
+            payloads: 已编码的消息段缓存，同一批次中相同的消息段只编码一次
+
+        Returns:
+            API 名称、参数、发送账号，以及账号是否由请求明确指定
+
+        Raises:
+            PermanentSendError: 频道ID无效
+        """
+        try:
+            target_id = int(request.channel_id)
+        except ValueError:
+            raise PermanentSendError(f"Invalid {request.channel.type.value} id: {request.channel_id}")
         message_type = "private" if request.channel.type == MessageType.PRIVATE else "group"
         action = "send_group_msg" if message_type == "group" else "send_private_msg"
-        
-        data = {
-            "action": action,
-            "params": {
-                "message": request.content,
-                "group_id" if message_type == "group" else "user_id": int(request.channel_id)
-            }
+
+        if request.segments is not None:
+            message = payloads.get(id(request.segments))
+            if message is None:
+                message = payloads[id(request.segments)] = encode_segments(request.segments)
+        else:
+            message = request.content
+        params = {
+            "message": message,
+            "group_id" if message_type == "group" else "user_id": target_id
         }
 
         # 处理QQ特定的参数
         if request.extra and hasattr(request.extra, 'at_sender'):
-            data["params"]["at_sender"] = request.extra.at_sender
+            params["at_sender"] = request.extra.at_sender
         if request.extra and hasattr(request.extra, 'auto_escape'):
-            data["params"]["auto_escape"] = request.extra.auto_escape
-        
-        async def _send():
-            success = await self.send_ws_message(data)
-            return "success" if success else None
-            
-        future = asyncio.run_coroutine_threadsafe(_send(), self.event_loop)
+            params["auto_escape"] = request.extra.auto_escape
+
+        # 优先使用请求指定的账号，其次使用最近在该频道收到消息的账号
+        # 明确指定的账号没有连接时不改用其他账号，以免从错误的账号发出
+        self_id = getattr(request.extra, 'self_id', None)
+        strict = self_id is not None
+        if self_id is None:
+            self_id = self.channel_accounts.get((message_type, str(request.channel_id)))
+        return action, params, str(self_id) if self_id is not None else None, strict
+
+    def submit_messages(self, requests: List[SendMessageRequest]) -> List['Future[Optional[str]]']:
+        """提交发送请求
+
+        所有 API 调用同时发出，按 echo 或 HTTP 连接池并发等待响应。
+        """
+        loop = self.event_loop
+        if not self.connected or not loop:
+            self.logger.error("Cannot send message: driver not connected")
+            return self.failed_futures(len(requests), RuntimeError("Driver not connected"))
+
+        payloads: Dict[int, str] = {}
+        futures = []
+        for request in requests:
+            # 检查是否需要处理这个请求
+            if request.platforms is not None and not {Platform.QQ, Platform.QQ.value} & set(request.platforms):
+                futures.extend(self.failed_futures(1, PermanentSendError("Request does not target QQ")))
+                continue
+            try:
+                call = self.build_send_call(request, payloads)
+            except PermanentSendError as e:
+                # 只有这一条请求失败，不影响同批次的其他请求
+                futures.extend(self.failed_futures(1, e))
+                continue
+            futures.append(asyncio.run_coroutine_threadsafe(self.send_call(*call), loop))
+        return futures
+
+    async def send_call(self, action: str, params: dict, self_id: Optional[str], strict: bool) -> Optional[str]:
+        """调用发送消息的 API，返回消息ID"""
         try:
-            return future.result(timeout=5)
-        except Exception as e:
-            self.logger.error(f"Error waiting for message result: {e}")
-            return None
+            data = await self.call_api(action, params, self_id=self_id, strict=strict)
+        except ActionFailed as e:
+            # OneBot 实现已收到并拒绝了请求，重试不会成功
+            raise PermanentSendError(f"retcode={e.result.get('retcode')}, {e.result.get('wording') or e.result.get('msg')}") from e
+        return str(data["message_id"]) if data and "message_id" in data else None
 
     async def start_ws_server(self):
         """启动反向 WebSocket 服务器"""
@@ -370,62 +614,126 @@ class QQDriver(BaseDriver):
             self.logger.error(f"Failed to start WebSocket server: {e}")
             raise
 
+    async def start_http(self):
+        """启动 HTTP API 客户端和事件上报接收端"""
+        self.logger.info("Starting HTTP client and webhook server...")
+        headers = {"Authorization": f"Bearer {self.access_token}"} if self.access_token else None
+        self.http_session = ClientSession(
+            connector=TCPConnector(limit=self.max_connections),
+            headers=headers
+        )
+        try:
+            self.runner = web.AppRunner(self.app)
+            await self.runner.setup()
+            self.site = web.TCPSite(self.runner, self.host, self.port)
+            await self.site.start()
+        except Exception:
+            await self.http_session.close()
+            raise
+        self.logger.info(f"Webhook server started at http://{self.host}:{self.port}{self.webhook_path}")
+        self.spawn_directory_task(self.preload_directory())
+
     async def start_ws_client(self):
-        """启动正向 WebSocket 客户端"""
+        """启动正向 WebSocket 客户端
+
+        接收循环在后台任务中运行，这里只等待首次握手完成或超时。
+        """
         self.logger.info("Starting WebSocket client...")
         self.client_session = ClientSession()
-        
-        async def connect_ws():
-            try:
-                headers = {"Authorization": f"Bearer {self.access_token}"} if self.access_token else None
-                self.ws_client = await self.client_session.ws_connect(
-                    self.ws_url,
-                    headers=headers,
-                    heartbeat=self.heartbeat
-                )
-                self.logger.info(f"Connected to WebSocket server at {self.ws_url}")
-                
-                async for msg in self.ws_client:
-                    if msg.type == web.WSMsgType.TEXT:
-                        try:
-                            data = json.loads(msg.data)
-                            # 忽略心跳消息和响应消息
-                            if data.get("meta_event_type") in ["lifecycle", "heartbeat"] or \
-                               data.get("status") == "ok":
-                                continue
-                                
-                            self.logger.debug(f"Received WebSocket message: {data}")
-                            # 创建事件对象并处理
-                            event = CQEvent.from_payload(data)
-                            if event.type == "message":
-                                await self.handle_msg(event)
-                            elif event.type == "notice":
-                                await self.handle_notice(event)
-                        except Exception as e:
-                            self.logger.error(f"Error handling WebSocket message: {e}")
-                    elif msg.type in [web.WSMsgType.CLOSED, web.WSMsgType.ERROR]:
-                        break
-            except Exception as e:
-                self.logger.error(f"WebSocket connection error: {e}")
-                return False
-            return True
-
-        # 启动重连任务
-        async def reconnect_loop():
-            while True:
-                if not self.ws_client or self.ws_client.closed:
-                    self.logger.info("Attempting to connect to WebSocket server...")
-                    if await connect_ws():
-                        return  # 连接成功后退出循环
-                    await asyncio.sleep(5)  # 重连延迟
-                await asyncio.sleep(1)
-
-        # 等待连接建立
+        self.ws_ready = asyncio.Event()
+        self.state = DriverState.CONNECTING
+        self.reconnect_task = asyncio.create_task(self.reconnect_loop())
+        try:
+            await asyncio.wait_for(self.ws_ready.wait(), timeout=self.READY_TIMEOUT)
+        except asyncio.TimeoutError:
+            self.logger.warning("WebSocket server not reachable yet, retrying in background")
+
+    async def reconnect_loop(self):
+        """正向 WebSocket 重连循环
+
+        按顺序尝试各个地址，全部失败时按指数退避等待；
+        连接断开后重新从第一个地址开始尝试。
+        """
+        backoff = Backoff()
+        while True:
+            for ws_url in self.ws_urls:
+                if await self.run_ws_session(ws_url):
+                    backoff.reset()
+                    break
+            self.state = DriverState.RECONNECTING
+            delay = backoff.next_delay()
+            self.logger.info(f"Reconnecting to WebSocket server in {delay:.1f}s...")
+            await asyncio.sleep(delay)
+
+    async def run_ws_session(self, ws_url: str) -> bool:
+        """连接到指定地址并接收消息，直到连接断开
+
+        连接由 aiohttp 按 heartbeat 间隔发送 ping，对端无响应时自动关闭。
+
+        Returns:
+            是否成功完成握手
+        """
+        headers = {"Authorization": f"Bearer {self.access_token}"} if self.access_token else None
         try:
-            await reconnect_loop()
+            self.ws_client = await self.client_session.ws_connect(
+                ws_url,
+                headers=headers,
+                heartbeat=self.heartbeat
+            )
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
-            self.logger.error(f"Failed to start WebSocket client: {e}")
+            self.last_error = f"{ws_url}: {e}"
+            self.logger.error(f"WebSocket connection error: {self.last_error}")
+            return False
+
+        self.logger.info(f"Connected to WebSocket server at {ws_url}")
+        self.state = DriverState.CONNECTED
+        self.last_error = None
+        self.ws_ready.set()
+        self.spawn_directory_task(self.preload_directory())
+        try:
+            async for msg in self.ws_client:
+                if msg.type == web.WSMsgType.TEXT:
+                    try:
+                        await self.handle_frame(msg.data)
+                    except Exception as e:
+                        self.logger.error(f"Error handling WebSocket message: {e}")
+                elif msg.type in [web.WSMsgType.CLOSED, web.WSMsgType.ERROR]:
+                    break
+            self.last_error = f"{ws_url}: connection closed ({self.ws_client.close_code})"
+        except asyncio.CancelledError:
             raise
+        except Exception as e:
+            self.last_error = f"{ws_url}: {e}"
+        finally:
+            await self.ws_client.close()
+        self.logger.warning(f"WebSocket connection lost: {self.last_error}")
+        return True
+
+    def is_ready(self) -> bool:
+        """是否可以立即发送消息，WebSocket 模式下需要 OneBot 实现已连接"""
+        if not self.connected:
+            return False
+        if self.connection_type == ConnectionType.WS_SERVER:
+            return bool(self.ws_connections)
+        if self.connection_type == ConnectionType.WS_CLIENT:
+            return self.state == DriverState.CONNECTED
+        return True
+
+    def get_status(self) -> str:
+        """获取驱动状态描述"""
+        if not self.connected:
+            return 'Disconnected'
+        if self.connection_type == ConnectionType.HTTP:
+            return f"Connected (API: {self.api_url})"
+        if self.connection_type == ConnectionType.WS_SERVER:
+            accounts = ", ".join(str(self_id) for self_id in self.ws_routes) or "none"
+            return f"Connected, {len(self.ws_connections)} connections (accounts: {accounts})"
+        status = self.state.value.capitalize()
+        if self.state != DriverState.CONNECTED and self.last_error:
+            status += f" (last error: {self.last_error})"
+        return status
 
 # 导出
 __all__ = ["QQDriver"]
\ No newline at end of file
@@ -1,17 +1,232 @@
-from telegram import Update, ChatMember, ChatMemberUpdated, Chat
-from telegram.ext import ApplicationBuilder, ContextTypes, MessageHandler, filters, Application, ChatMemberHandler, CommandHandler
+from telegram import Bot, Update, ChatMember, ChatMemberUpdated, Chat
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TimedOut
+from telegram.ext import ApplicationBuilder, BaseHandler, BaseUpdateProcessor, ContextTypes, MessageHandler, filters, Application, ChatMemberHandler, CommandHandler
 from mcdreforged.api.all import *
-from typing import Optional
-import threading
+from typing import Any, Awaitable, Dict, Iterable, List, Optional, Set, Tuple
+import asyncio
+import hmac
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from datetime import timedelta
 
-from im_api.config import TelegramConfig
-from im_api.drivers.base import BaseDriver, Platform
+from aiohttp import web
+
+from im_api.config import TelegramConfig, TelegramMode
+from im_api.drivers.base import BaseDriver, DriverState, OutboundMessage, OutboundQueue, PermanentSendError, Platform
 from im_api.models.message import Message, Event, User, Channel
 from im_api.models.request import ChannelInfo, SendMessageRequest, MessageType
 
+# MessageHandler 可能匹配的更新类型
+MESSAGE_UPDATE_TYPES = frozenset({
+    Update.MESSAGE, Update.EDITED_MESSAGE,
+    Update.CHANNEL_POST, Update.EDITED_CHANNEL_POST,
+    Update.BUSINESS_MESSAGE, Update.EDITED_BUSINESS_MESSAGE,
+})
+
+# 限定更新类型的过滤器
+_UPDATE_TYPE_FILTERS = (
+    (filters.UpdateType.MESSAGE, {Update.MESSAGE}),
+    (filters.UpdateType.EDITED_MESSAGE, {Update.EDITED_MESSAGE}),
+    (filters.UpdateType.MESSAGES, {Update.MESSAGE, Update.EDITED_MESSAGE}),
+    (filters.UpdateType.CHANNEL_POST, {Update.CHANNEL_POST}),
+    (filters.UpdateType.EDITED_CHANNEL_POST, {Update.EDITED_CHANNEL_POST}),
+    (filters.UpdateType.CHANNEL_POSTS, {Update.CHANNEL_POST, Update.EDITED_CHANNEL_POST}),
+    (filters.UpdateType.BUSINESS_MESSAGE, {Update.BUSINESS_MESSAGE}),
+    (filters.UpdateType.EDITED_BUSINESS_MESSAGE, {Update.EDITED_BUSINESS_MESSAGE}),
+    (filters.UpdateType.BUSINESS_MESSAGES, {Update.BUSINESS_MESSAGE, Update.EDITED_BUSINESS_MESSAGE}),
+    (filters.UpdateType.EDITED, {Update.EDITED_MESSAGE, Update.EDITED_CHANNEL_POST, Update.EDITED_BUSINESS_MESSAGE}),
+)
+
+
+def get_filter_update_types(message_filter: Any) -> Set[str]:
+    """计算消息过滤器可能匹配的更新类型，无法判断时返回全部消息类型"""
+    for update_filter, update_types in _UPDATE_TYPE_FILTERS:
+        if message_filter is update_filter:
+            return set(update_types)
+    base_filter = getattr(message_filter, "base_filter", None)
+    if getattr(message_filter, "and_filter", None) is not None:
+        return get_filter_update_types(base_filter) & get_filter_update_types(message_filter.and_filter)
+    if getattr(message_filter, "or_filter", None) is not None:
+        return get_filter_update_types(base_filter) | get_filter_update_types(message_filter.or_filter)
+    return set(MESSAGE_UPDATE_TYPES)
+
+
+def get_allowed_updates(handlers: Iterable[BaseHandler]) -> List[str]:
+    """根据已注册的处理器计算需要订阅的更新类型
+
+    遇到无法判断的处理器时订阅全部类型。
+    """
+    allowed: Set[str] = set()
+    for handler in handlers:
+        if isinstance(handler, MessageHandler):
+            allowed |= get_filter_update_types(handler.filters)
+        elif isinstance(handler, ChatMemberHandler):
+            if handler.chat_member_types != ChatMemberHandler.CHAT_MEMBER:
+                allowed.add(Update.MY_CHAT_MEMBER)
+            if handler.chat_member_types != ChatMemberHandler.MY_CHAT_MEMBER:
+                allowed.add(Update.CHAT_MEMBER)
+        else:
+            return list(Update.ALL_TYPES)
+    return sorted(allowed)
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """并发处理更新，同一会话的更新按到达顺序依次处理
+
+    先按会话排队再占用并发名额，只有每个会话排在最前的更新会占用名额，
+    避免同一会话的积压更新占满名额而阻塞其他会话。
+    并发名额由自己的信号量限制，基类的名额设为不会用尽的数量。
+    """
+
+    UNLIMITED = 2 ** 16  # 交给基类的并发上限
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(self.UNLIMITED)
+        self._slots = asyncio.Semaphore(max_concurrent_updates)
+        self._chat_locks: Dict[int, Tuple[asyncio.Lock, int]] = {}  # 会话ID -> (锁, 等待和处理中的更新数)
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        chat = update.effective_chat if isinstance(update, Update) else None
+        if chat is None:
+            async with self._slots:
+                await coroutine
+            return
+        lock, count = self._chat_locks.get(chat.id, (None, 0))
+        if lock is None:
+            lock = asyncio.Lock()
+        self._chat_locks[chat.id] = (lock, count + 1)
+        try:
+            async with lock:
+                async with self._slots:
+                    await coroutine
+        finally:
+            lock, count = self._chat_locks[chat.id]
+            if count > 1:
+                self._chat_locks[chat.id] = (lock, count - 1)
+            else:
+                del self._chat_locks[chat.id]
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+
+class TokenBucket:
+    """令牌桶，需在同一事件循环中使用"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate  # 每秒补充的令牌数
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def refill(self) -> None:
+        """按经过的时间补充令牌"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def full(self) -> bool:
+        """令牌是否已补满，补满的桶可以丢弃"""
+        self.refill()
+        return self.tokens >= self.capacity
+
+    def take(self) -> float:
+        """尝试取出一个令牌，成功返回 0，否则返回需要等待的时间（秒）"""
+        self.refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def pause(self, seconds: float) -> None:
+        """清空令牌，经过指定时间后才能再取出"""
+        self.refill()
+        self.tokens = 1 - seconds * self.rate
+
+    async def acquire(self) -> None:
+        """等待直到取得一个令牌"""
+        while (delay := self.take()) > 0:
+            await asyncio.sleep(delay)
+
+
+class TelegramOutboundQueue(OutboundQueue):
+    """Telegram 出站消息队列
+
+    发送前需同时取得全局和会话的令牌，遇到 RetryAfter 时暂停该会话并重试，
+    连接失败时指数退避。
+    """
+
+    GLOBAL_RATE = 30          # 全局每秒最多发送的消息数
+    PRIVATE_RATE = 1          # 私聊每秒最多发送的消息数
+    GROUP_RATE = 20 / 60      # 群组每秒最多发送的消息数
+    GROUP_BURST = 3           # 群组允许的突发消息数
+    MAX_IDLE_BUCKETS = 1024   # 超过该数量时清理已补满的会话令牌桶
+
+    def __init__(self, bot: Bot, max_retries: int = 5, base_delay: float = 1, max_delay: float = 60):
+        super().__init__(max_retries, base_delay, max_delay)
+        self.bot = bot
+        self.global_bucket = TokenBucket(self.GLOBAL_RATE, self.GLOBAL_RATE)
+        self._buckets: Dict[int, TokenBucket] = {}
+
+    def get_bucket(self, chat_id: int) -> TokenBucket:
+        """获取会话的令牌桶，群组和频道的ID为负数"""
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            if len(self._buckets) >= self.MAX_IDLE_BUCKETS:
+                self._buckets = {
+                    key: value for key, value in self._buckets.items()
+                    if key in self._queues or not value.full()
+                }
+            if chat_id < 0:
+                bucket = TokenBucket(self.GROUP_RATE, self.GROUP_BURST)
+            else:
+                bucket = TokenBucket(self.PRIVATE_RATE, 1)
+            self._buckets[chat_id] = bucket
+        return bucket
+
+    async def _send(self, message: OutboundMessage) -> str:
+        bucket = self.get_bucket(message.key)
+        attempt = 0
+        while True:
+            await bucket.acquire()
+            await self.global_bucket.acquire()
+            try:
+                result = await self.bot.send_message(chat_id=message.key, text=message.payload)
+                return str(result.message_id)
+            except RetryAfter as e:
+                # 限流不计入重试次数
+                self.throttled += 1
+                retry_after = e.retry_after
+                if isinstance(retry_after, timedelta):
+                    retry_after = retry_after.total_seconds()
+                bucket.pause(retry_after)
+                continue
+            except TimedOut:
+                # 请求可能已送达，重试会导致重复发送
+                raise
+            except (BadRequest, Forbidden) as e:
+                # 会话不存在、被移出群组等，BadRequest 同样是 NetworkError 的子类，需先处理
+                raise PermanentSendError(str(e)) from e
+            except NetworkError as e:
+                attempt += 1
+                await self.backoff(attempt, e)
+
+    def close(self, reason: str = "Telegram driver disconnected") -> None:
+        """取消所有发送协程，未发送的消息以异常结束"""
+        super().close(reason)
+        self._buckets.clear()
+
+
 class TeleGramDriver(BaseDriver):
     """Telegram 驱动实现"""
     application: Application
+    CONNECT_TIMEOUT = 10  # 等待开始接收更新的最长时间（秒）
+    CONNECTION_POOL_SIZE = 32  # 发送请求的连接池大小，与全局发送速率相当即可
+    MAX_CONCURRENT_UPDATES = 64  # 同时处理的更新数
+
     @classmethod
     def get_platform(cls) -> Platform:
         return Platform.TELEGRAM
@@ -20,9 +235,16 @@ class TeleGramDriver(BaseDriver):
         super().__init__(config)
         self.token = config.token
         self.proxy_url = config.http_proxy  # 默认代理设置
+        self.mode = config.mode
+        self.webhook = config.webhook
+        self.webhook_runner: Optional[web.AppRunner] = None
         self.application = None
-        self.event_loop = None  # 添加事件循环引用
-        self.stop_event = threading.Event()  # 添加停止事件
+        self.event_loop = None  # 机器人所在的事件循环
+        self.stop_signal: Optional[asyncio.Event] = None  # 停止信号，在事件循环中等待
+        self.ready: Optional[Future] = None  # 开始轮询或启动失败时完成
+        self.bot_thread = None
+        self.outbound: Optional[TelegramOutboundQueue] = None
+        self.allowed_updates: List[str] = list(Update.ALL_TYPES)  # 根据已注册的处理器计算
         
     async def handle_message(self, update: Update, ctx: ContextTypes.DEFAULT_TYPE):
         """处理消息事件"""
@@ -84,78 +306,162 @@ class TeleGramDriver(BaseDriver):
         if self.event_callback:
             self.event_callback(Platform.TELEGRAM, event)
                     
+    async def handle_webhook(self, request: web.Request) -> web.Response:
+        """接收 Telegram 推送的更新，交给 Application 的更新队列处理"""
+        secret_token = self.webhook.secret_token
+        if secret_token and not hmac.compare_digest(
+                request.headers.get("X-Telegram-Bot-Api-Secret-Token", ""), secret_token):
+            self.logger.warning(f"Rejected webhook request with invalid secret token from {request.remote}")
+            return web.Response(status=403)
+        application = self.application
+        if application is None:
+            return web.Response(status=503)
+        try:
+            update = Update.de_json(await request.json(), application.bot)
+        except Exception as e:
+            self.logger.error(f"Invalid webhook update: {e}")
+            return web.Response(status=400)
+        await application.update_queue.put(update)
+        return web.Response()
+
+    async def start_webhook(self, application: Application):
+        """启动本地 Webhook 服务，配置了对外地址时同时设置 Webhook"""
+        app = web.Application()
+        app.router.add_post(self.webhook.path, self.handle_webhook)
+        self.webhook_runner = web.AppRunner(app)
+        await self.webhook_runner.setup()
+        await web.TCPSite(self.webhook_runner, self.webhook.host, self.webhook.port).start()
+        self.logger.info(f"Telegram webhook listening at http://{self.webhook.host}:{self.webhook.port}{self.webhook.path}")
+        if self.webhook.url:
+            await application.bot.set_webhook(
+                url=self.webhook.url,
+                secret_token=self.webhook.secret_token or None,
+                allowed_updates=self.allowed_updates
+            )
+
+    async def stop_webhook(self):
+        """停止本地 Webhook 服务"""
+        if self.webhook_runner is not None:
+            await self.webhook_runner.cleanup()
+            self.webhook_runner = None
+
+    async def run_bot(self):
+        """运行机器人直到收到停止信号
+
+        使用 Application 自身的异步启动和停止接口，开始接收更新后通过 ready 通知 connect。
+        """
+        self.event_loop = asyncio.get_running_loop()
+        self.stop_signal = asyncio.Event()
+        try:
+            # 令牌格式、代理配置等错误在构建时即抛出，同样经 ready 通知 connect
+            builder = ApplicationBuilder().token(self.token).connection_pool_size(self.CONNECTION_POOL_SIZE) \
+                .concurrent_updates(ChatOrderedUpdateProcessor(self.MAX_CONCURRENT_UPDATES))
+            if self.proxy_url:
+                builder = builder.proxy(self.proxy_url).get_updates_proxy(self.proxy_url)
+            if self.mode == TelegramMode.WEBHOOK:
+                # 更新由本地 Webhook 服务放入更新队列，不需要 Updater
+                builder = builder.updater(None)
+            application = builder.build()
+            # 注册消息处理器
+            application.add_handler(MessageHandler(filters.UpdateType.MESSAGE & filters.TEXT, self.handle_message))
+            application.add_handler(ChatMemberHandler(self.handle_chat_member, ChatMemberHandler.CHAT_MEMBER))
+            # 只订阅会被处理的更新类型
+            self.allowed_updates = get_allowed_updates(
+                handler for handlers in application.handlers.values() for handler in handlers
+            )
+            async with application:
+                await application.start()
+                # Webhook 服务需要在 application 设置后才接收更新
+                self.application = application
+                self.outbound = TelegramOutboundQueue(application.bot)
+                try:
+                    if self.mode == TelegramMode.WEBHOOK:
+                        await self.start_webhook(application)
+                    else:
+                        await application.updater.start_polling(allowed_updates=self.allowed_updates)
+                    if self.ready.cancelled():
+                        # connect 已超时放弃，直接停止
+                        self.stop_signal.set()
+                    else:
+                        self.state = DriverState.CONNECTED
+                        self.ready.set_result(True)
+                    await self.stop_signal.wait()
+                finally:
+                    self.logger.info("Telegram bot stopping")
+                    self.application = None
+                    self.outbound.close()
+                    self.outbound = None
+                    if self.mode == TelegramMode.WEBHOOK:
+                        await self.stop_webhook()
+                    elif application.updater.running:
+                        await application.updater.stop()
+                    await application.stop()
+        except Exception as e:
+            self.last_error = str(e)
+            if not self.ready.done():
+                self.ready.set_exception(e)
+            else:
+                self.logger.error(f"Telegram bot stopped unexpectedly: {e}")
+        finally:
+            self.application = None
+            self.connected = False
+            self.state = DriverState.DISCONNECTED
+            self.event_loop = None
+
     def connect(self) -> None:
         """连接到Telegram平台"""
         if self.connected:
             return
-            
-        def start_bot():
-            import asyncio
-            loop = asyncio.new_event_loop()
-            self.event_loop = loop  # 保存事件循环引用
-            asyncio.set_event_loop(loop)
-            try:
-                builder = ApplicationBuilder().token(self.token)
-                if self.proxy_url is not None:
-                    builder = builder.proxy(self.proxy_url).get_updates_proxy(self.proxy_url)
-                self.application = builder.build()
-                # 注册消息处理器
-                self.application.add_handler(MessageHandler(filters.TEXT, self.handle_message))
-                self.application.add_handler(ChatMemberHandler(self.handle_chat_member, ChatMemberHandler.CHAT_MEMBER))
-                # 创建停止检查线程
-                def check_stop():
-                    asyncio.set_event_loop(loop)
-                    while True:
-                        if self.stop_event.is_set():
-                            self.logger.warn('Telegram bot stopping')
-                            self.event_loop.stop()
-                            self.logger.warn('Telegram bot stopped')
-                            break
-                        time.sleep(0.5)
-                
-                # 启动停止检查线程
-                stop_thread = threading.Thread(target=check_stop, daemon=True)
-                stop_thread.start()
-                self.application.run_polling(stop_signals=None, allowed_updates=Update.ALL_TYPES)
-            except Exception as e:
-                print(e)
-                self.logger.error(f"Failed to connect Telegram driver: {e}")
-                self.connected = False  # 确保连接状态正确
-                
-        # 在后台线程中启动机器人
-        import threading
-        self.bot_thread = threading.Thread(target=start_bot, daemon=True)
-        self.bot_thread.start()
-        self.logger.info("Telegram driver connected successfully")
-        # 等待连接建立
-        import time
-        start_time = time.time()
-        while (not self.application or not self.application.running) and time.time() - start_time < 10:  # 最多等待10秒
-            time.sleep(0.1)
-        if not self.application or not self.application.running:
-            self.logger.error("Failed to connect Telegram driver: timeout")
+
+        self.ready = Future()
+        self.state = DriverState.CONNECTING
+
+        @new_thread('ImAPI: TelegramReceiver')
+        def run_bot_thread():
+            asyncio.run(self.run_bot())
+
+        self.bot_thread = run_bot_thread()
+        try:
+            # 开始接收更新后立即返回
+            self.ready.result(timeout=self.CONNECT_TIMEOUT)
+        except FutureTimeoutError:
+            # 取消失败说明 ready 恰好已完成，可能是开始轮询，也可能是启动失败
+            if self.ready.cancel():
+                self.logger.error("Failed to connect Telegram driver: timeout")
+                self.stop_bot()
+                return
+            if self.ready.exception() is not None:
+                self.logger.error(f"Failed to connect Telegram driver: {self.ready.exception()}")
+                return
+        except Exception as e:
+            self.logger.error(f"Failed to connect Telegram driver: {e}")
+            return
         self.connected = True
-    
+        self.logger.info("Telegram driver connected successfully")
+
+    def stop_bot(self):
+        """通知机器人所在的事件循环停止运行"""
+        loop, stop_signal = self.event_loop, self.stop_signal
+        if loop is None or stop_signal is None:
+            return
+        try:
+            loop.call_soon_threadsafe(stop_signal.set)
+        except RuntimeError:
+            # 事件循环已关闭
+            pass
+
     def disconnect(self) -> None:
         """断开与Telegram平台的连接"""
         if not self.connected:
             return
-            
-        try:
-            # 设置停止事件，通知bot线程停止运行
-            self.stop_event.set()
-            
-            # 等待后台线程结束
-            if self.bot_thread and self.bot_thread.is_alive():
-                self.bot_thread.join(timeout=5)
-            
-            self.connected = False
-            self.event_loop = None  # 清理事件循环引用
-            self.application = None
-            self.stop_event.clear()  # 重置停止事件
-            self.logger.info("Telegram driver disconnected")
-        except Exception as e:
-            self.logger.error(f"Error disconnecting Telegram driver: {e}")
+
+        self.stop_bot()
+        # 轮询请求会被立即中断，线程很快结束
+        if self.bot_thread and self.bot_thread.is_alive():
+            self.bot_thread.join(timeout=5)
+        self.connected = False
+        self.bot_thread = None
+        self.logger.info("Telegram driver disconnected")
     
     def send_message(self, request: SendMessageRequest) -> Optional[str]:
         """发送消息到Telegram
@@ -166,23 +472,43 @@ class TeleGramDriver(BaseDriver):
         Returns:
             消息ID, 如果发送失败则返回 None
         """
-        if not self.connected or not self.application:
+        return self.send_messages([request])[0]
+
+    def submit_messages(self, requests: List[SendMessageRequest]) -> List['Future[Optional[str]]']:
+        """提交到机器人所在的事件循环，经出站队列按会话顺序发送，不同会话并发发送"""
+        outbound, loop = self.outbound, self.event_loop
+        if not self.connected or outbound is None or loop is None:
             self.logger.error("Cannot send message: driver not connected")
-            return None
-        async def _send_message():
-            return await self.application.bot.send_message(
-                chat_id=int(request.channel_id),
-                text=request.content
-            )
-        try:
-            import asyncio
-            future = asyncio.run_coroutine_threadsafe(_send_message(), self.event_loop)
-            # 最多等待5s
-            result = future.result(timeout=5)
-            return str(result.message_id)
-        except Exception as e:
-            self.logger.error(f"Error sending message: {e}")
-            return None
+            return self.failed_futures(len(requests), RuntimeError("Driver not connected"))
+        futures = []
+        for request in requests:
+            try:
+                chat_id = int(request.channel_id)
+            except ValueError:
+                # 只有这一条请求失败，不影响同批次的其他请求
+                futures.extend(self.failed_futures(1, PermanentSendError(f"Invalid chat id: {request.channel_id}")))
+                continue
+            futures.append(asyncio.run_coroutine_threadsafe(outbound.send(chat_id, request.content), loop))
+        return futures
+
+    def get_queue_depth(self, chat_id: Optional[int] = None) -> int:
+        """获取出站队列中待发送的消息数量
+
+        Args:
+            chat_id: 会话ID，为 None 时返回所有会话的总数
+        """
+        outbound = self.outbound
+        return outbound.depth(chat_id) if outbound is not None else 0
+
+    def get_status(self) -> str:
+        """获取驱动状态描述"""
+        status = self.state.value.capitalize()
+        outbound = self.outbound
+        if outbound is not None:
+            status += f", {outbound.depth()} messages queued, {outbound.sent} sent, {outbound.throttled} throttled"
+        if self.state != DriverState.CONNECTED and self.last_error:
+            status += f" (last error: {self.last_error})"
+        return status
 
 # 导出
 __all__ = ["TeleGramDriver"]
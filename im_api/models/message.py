@@ -1,5 +1,6 @@
-from dataclasses import dataclass
-from typing import Any, Dict, Optional
+from dataclasses import dataclass, field
+from functools import cached_property
+from typing import Any, Callable, Dict, List, Optional, Set
 
 from im_api.models.platform import Platform
 
@@ -42,6 +43,17 @@ class Channel:
         )
 
 
+@dataclass
+class Segment:
+    """消息段"""
+    type: str                    # 段类型 (text/at/reply/image/face 等)
+    data: Dict[str, Any] = field(default_factory=dict)  # 段参数
+
+    @classmethod
+    def text(cls, text: str) -> 'Segment':
+        return cls('text', {'text': text})
+
+
 @dataclass
 class Message:
     """消息对象"""
@@ -52,6 +64,25 @@ class Message:
     platform: Optional[Platform] = None  # 消息来源平台
     reply_to: Optional[str] = None  # 回复的消息ID
     created_at: Optional[str] = None  # 消息创建时间
+    # 消息段解析器，由驱动提供，首次访问 segments 时才解析
+    segment_parser: Optional[Callable[[str], List[Segment]]] = field(default=None, repr=False, compare=False)
+
+    @cached_property
+    def segments(self) -> List[Segment]:
+        """消息段列表，解析一次后缓存"""
+        if self.segment_parser is None:
+            return [Segment.text(self.content)]
+        return self.segment_parser(self.content)
+
+    @cached_property
+    def plain_text(self) -> str:
+        """纯文本内容，去除 @、图片等非文本段"""
+        return "".join(seg.data.get('text', '') for seg in self.segments if seg.type == 'text')
+
+    @cached_property
+    def mentions(self) -> Set[str]:
+        """被 @ 的用户ID集合，@全体成员 时包含 all"""
+        return {str(seg.data.get('qq')) for seg in self.segments if seg.type == 'at'}
 
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> 'Message':
@@ -89,5 +120,5 @@ class Event:
 
 
 # 导出
-__all__ = ["User", "Channel", "Message", "Event"]
+__all__ = ["User", "Channel", "Segment", "Message", "Event"]
 
@@ -2,6 +2,7 @@ from dataclasses import dataclass, field
 from enum import Enum
 from typing import Any, Dict, List, Optional, Union, Set
 
+from im_api.models.message import Segment
 from im_api.models.platform import Platform
 
 
@@ -34,6 +35,7 @@ class SendMessageRequest:
     platforms: Optional[Set[Union[Platform, str]]] = None  # 目标平台列表，None表示所有平台
     extra: Optional[MessageExtra] = None  # 平台特定的额外参数
     raw_extra: Dict[str, Any] = field(default_factory=dict)  # 原始额外参数
+    segments: Optional[List[Segment]] = None  # 结构化消息段，支持的平台优先于 content 使用
 
     @property
     def channel_id(self) -> str:
@@ -41,6 +43,28 @@ class SendMessageRequest:
         return self.channel.id
 
 
+class SendStatus(Enum):
+    """发送结果状态"""
+    SUCCESS = "success"    # 发送成功
+    FAILED = "failed"      # 发送失败
+    TIMEOUT = "timeout"    # 超过时限仍未完成
+    QUEUED = "queued"      # 平台暂不可用，已写入出站日志，恢复后重发
+
+
+@dataclass
+class SendResult:
+    """单个平台的发送结果"""
+    platform: Platform                # 目标平台
+    status: SendStatus                # 结果状态
+    message_id: Optional[str] = None  # 消息ID，发送成功时有效
+    error: Optional[str] = None       # 失败原因
+
+    @property
+    def ok(self) -> bool:
+        """是否发送成功"""
+        return self.status == SendStatus.SUCCESS
+
+
 # QQ平台特定的额外参数
 @dataclass
 class QQMessageExtra(MessageExtra):
@@ -48,6 +72,7 @@ class QQMessageExtra(MessageExtra):
     at_sender: bool = False          # 是否at发送者
     auto_escape: bool = False        # 是否转义CQ码
     user_id: Optional[int] = None    # QQ号（私聊消息）
+    self_id: Optional[int] = None    # 发送消息的机器人QQ号（连接了多个账号时）
 
 
 # KOOK平台特定的额外参数
@@ -67,4 +92,7 @@ class DiscordMessageExtra(MessageExtra):
 
 
 # 导出
-__all__ = ["MessageType", "MessageExtra", "QQMessageExtra", "ChannelInfo", "SendMessageRequest"]
\ No newline at end of file
+__all__ = [
+    "MessageType", "MessageExtra", "QQMessageExtra", "ChannelInfo", "SendMessageRequest",
+    "SendStatus", "SendResult"
+]
\ No newline at end of file
@@ -0,0 +1,17 @@
+import logging
+from types import SimpleNamespace
+
+import pytest
+
+from im_api.core.context import Context
+
+
+@pytest.fixture
+def context(tmp_path, monkeypatch):
+    """以临时目录作为 MCDR 工作目录的插件上下文"""
+    context = Context.get_instance()
+    monkeypatch.setattr(context, "server", SimpleNamespace(
+        logger=logging.getLogger("im_api.test"),
+        get_mcdr_config=lambda: {"working_directory": str(tmp_path / "server")}
+    ))
+    return context
@@ -0,0 +1,100 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from im_api.config import ImAPIConfig, SpoolConfig
+from im_api.core.bridge import MessageBridge
+from im_api.drivers.base import BaseDriver, PermanentSendError
+from im_api.models.platform import Platform
+from im_api.models.request import ChannelInfo, MessageType, SendMessageRequest, SendStatus
+
+
+class FakeDriver(BaseDriver):
+    """按消息内容决定发送结果的驱动
+
+    slow 发送耗时 1.5 秒，invalid 以 PermanentSendError 失败，flaky 第一次发送失败。
+    """
+
+    def __init__(self):
+        super().__init__({})
+        self.connected = True
+        self.sent = []
+        self.attempts = {}
+
+    @classmethod
+    def get_platform(cls) -> Platform:
+        return Platform.QQ
+
+    def connect(self) -> None:
+        pass
+
+    def disconnect(self) -> None:
+        pass
+
+    def is_ready(self) -> bool:
+        return True
+
+    def send_message(self, request: SendMessageRequest):
+        self.attempts[request.content] = self.attempts.get(request.content, 0) + 1
+        if request.content == "slow":
+            time.sleep(1.5)
+        elif request.content == "invalid":
+            raise PermanentSendError("Invalid channel id")
+        elif request.content == "flaky" and self.attempts[request.content] == 1:
+            raise RuntimeError("Driver not connected")
+        self.sent.append(request.content)
+        return str(len(self.sent))
+
+
+@pytest.fixture
+def bridge(context, monkeypatch):
+    monkeypatch.setattr(context, "config", ImAPIConfig([], SpoolConfig(enabled=True)))
+    monkeypatch.setattr(MessageBridge, "REPLAY_INTERVAL", 0.2)
+    driver = FakeDriver()
+    bridge = MessageBridge(
+        SimpleNamespace(register_event_listener=lambda *args: None),
+        SimpleNamespace(get_all_drivers=lambda: [driver])
+    )
+    yield bridge, driver
+    bridge.shutdown()
+
+
+def request(content: str) -> SendMessageRequest:
+    return SendMessageRequest(ChannelInfo("1", MessageType.CHANNEL), content)
+
+
+def test_timed_out_send_is_not_replayed(bridge):
+    """超过总时限仍在发送的消息不能被推迟重发，否则会重复发送"""
+    bridge, driver = bridge
+    result = bridge.submit(request("slow"), timeout=0.5).result()
+    assert result[Platform.QQ].status == SendStatus.TIMEOUT
+
+    # 等待发送完成并经过若干轮重发检查
+    time.sleep(2.5)
+    assert driver.sent == ["slow"]
+    assert bridge.spool.size == 0
+    assert bridge.spool.depth() == 0
+
+
+def test_permanent_failure_is_dropped(bridge):
+    """请求本身无效的消息直接丢弃，不重发"""
+    bridge, driver = bridge
+    results = bridge.submit_batch([request("invalid"), request("hello")]).result()
+    assert results[0][Platform.QQ].status == SendStatus.FAILED
+    assert results[1][Platform.QQ].status == SendStatus.SUCCESS
+
+    time.sleep(0.6)
+    assert driver.attempts["invalid"] == 1
+    assert bridge.spool.size == 0
+
+
+def test_transient_failure_is_replayed(bridge):
+    """临时错误的消息排入日志，恢复后重发一次"""
+    bridge, driver = bridge
+    result = bridge.submit(request("flaky")).result()
+    assert result[Platform.QQ].status == SendStatus.QUEUED
+
+    time.sleep(0.6)
+    assert driver.sent == ["flaky"]
+    assert bridge.spool.size == 0
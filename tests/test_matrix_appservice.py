@@ -0,0 +1,105 @@
+import asyncio
+import time
+
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+from im_api.config import MatrixAppServiceConfig, MatrixConfig
+from im_api.drivers.matrix import AppServiceServer, MatrixDriver
+
+HS_TOKEN = "hs-secret"
+ROOM_ID = "!room:example.org"
+SENDER = "@alice:example.org"
+
+
+def fake_homeserver() -> web.Application:
+    """只实现房间状态和用户资料查询的家服务器"""
+    async def handle(request: web.Request) -> web.Response:
+        if request.path.endswith("/state"):
+            return web.json_response([{
+                "type": "m.room.member", "state_key": SENDER, "sender": SENDER, "event_id": "$member",
+                "origin_server_ts": 0, "content": {"membership": "join", "displayname": "Alice"}
+            }])
+        if "/profile/" in request.path:
+            return web.json_response({"displayname": "Alice"})
+        return web.json_response({"errcode": "M_UNRECOGNIZED"}, status=404)
+
+    app = web.Application()
+    app.router.add_route("*", "/{tail:.*}", handle)
+    return app
+
+
+def text_event(event_id: str, body: str) -> dict:
+    return {
+        "type": "m.room.message", "room_id": ROOM_ID, "sender": SENDER, "event_id": event_id,
+        "origin_server_ts": int(time.time() * 1000), "content": {"msgtype": "m.text", "body": body}
+    }
+
+
+async def run_appservice(scenario) -> list:
+    """启动假家服务器和应用服务接收端，运行场景后返回转发的消息"""
+    homeserver = TestServer(fake_homeserver())
+    await homeserver.start_server()
+    driver = MatrixDriver(MatrixConfig(
+        enabled=True, account={"user_id": "@bot:example.org", "token": "as-token"},
+        homeserver="example.org", mode="appservice", sync={}, appservice={}
+    ))
+    driver.homeserver = str(homeserver.make_url("")).rstrip("/")
+    driver.client = driver.create_client()
+    messages = []
+    driver.register_callbacks(lambda platform, message: messages.append(message), lambda platform, event: None)
+
+    server = AppServiceServer(MatrixAppServiceConfig(hs_token=HS_TOKEN), driver.on_appservice_events)
+    client = TestClient(TestServer(server.app))
+    await client.start_server()
+    try:
+        await scenario(client)
+    finally:
+        await client.close()
+        await driver.client.close()
+        await homeserver.close()
+    return messages
+
+
+def put_transaction(client: TestClient, txn_id: str, events: list, token: str = HS_TOKEN):
+    headers = {"Authorization": f"Bearer {token}"} if token is not None else {}
+    return client.put(f"/_matrix/app/v1/transactions/{txn_id}", json={"events": events}, headers=headers)
+
+
+def test_rejects_bad_hs_token(context):
+    async def scenario(client):
+        response = await put_transaction(client, "1", [text_event("$1", "wrong")], token="wrong")
+        assert response.status == 403
+        response = await put_transaction(client, "2", [text_event("$2", "missing")], token=None)
+        assert response.status == 403
+        response = await client.put("/transactions/3?access_token=wrong", json={"events": []})
+        assert response.status == 403
+
+    assert asyncio.run(run_appservice(scenario)) == []
+
+
+def test_events_reach_message_callback(context):
+    async def scenario(client):
+        response = await put_transaction(client, "1", [text_event("$1", "hello")])
+        assert response.status == 200
+
+    messages = asyncio.run(run_appservice(scenario))
+    assert [message.content for message in messages] == ["hello"]
+    assert messages[0].channel.id == ROOM_ID
+    assert messages[0].user.id == SENDER
+    assert messages[0].user.name == "Alice"
+
+
+def test_replayed_transaction_is_deduplicated(context):
+    async def scenario(client):
+        for _ in range(2):
+            response = await put_transaction(client, "txn-1", [text_event("$1", "once")])
+            assert response.status == 200
+        # 旧版路径上的同一事务同样去重
+        response = await client.put(f"/transactions/txn-1?access_token={HS_TOKEN}", json={"events": [text_event("$1", "once")]})
+        assert response.status == 200
+        response = await put_transaction(client, "txn-2", [text_event("$2", "twice")])
+        assert response.status == 200
+
+    messages = asyncio.run(run_appservice(scenario))
+    assert [message.content for message in messages] == ["once", "twice"]
@@ -0,0 +1,92 @@
+import asyncio
+import socket
+
+from aiohttp import ClientSession, web
+from aiohttp.test_utils import TestServer
+from telegram.ext import ApplicationBuilder, MessageHandler, filters
+
+from im_api.config import TelegramConfig
+from im_api.drivers.tg import TeleGramDriver
+
+SECRET = "webhook-secret"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def fake_bot_api() -> web.Application:
+    """只实现 getMe 的 Bot API"""
+    async def handle(request: web.Request) -> web.Response:
+        if request.path.endswith("/getMe"):
+            return web.json_response({"ok": True, "result": {"id": 1, "is_bot": True, "first_name": "bot", "username": "bot"}})
+        return web.json_response({"ok": False, "error_code": 404, "description": "Not Found"}, status=404)
+
+    app = web.Application()
+    app.router.add_route("*", "/{tail:.*}", handle)
+    return app
+
+
+def text_update(update_id: int, text: str) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id, "date": 0, "text": text,
+            "chat": {"id": -100, "type": "group", "title": "Group"},
+            "from": {"id": 42, "is_bot": False, "first_name": "Bob"}
+        }
+    }
+
+
+async def run_webhook(scenario) -> list:
+    """以 Webhook 模式启动驱动的接收端，运行场景后返回转发的消息"""
+    bot_api = TestServer(fake_bot_api())
+    await bot_api.start_server()
+    port = free_port()
+    driver = TeleGramDriver(TelegramConfig(
+        enabled=True, token="1:token", http_proxy="", mode="webhook",
+        webhook={"host": "127.0.0.1", "port": port, "path": "/telegram", "secret_token": SECRET}
+    ))
+    messages = []
+    driver.register_callbacks(lambda platform, message: messages.append(message), lambda platform, event: None)
+
+    # 与 run_bot 相同的 Application 配置，Bot API 指向本地
+    application = ApplicationBuilder().token(driver.token).base_url(str(bot_api.make_url("/bot"))).updater(None).build()
+    application.add_handler(MessageHandler(filters.UpdateType.MESSAGE & filters.TEXT, driver.handle_message))
+    try:
+        async with application:
+            await application.start()
+            driver.application = application
+            await driver.start_webhook(application)
+            try:
+                async with ClientSession() as session:
+                    await scenario(session, f"http://127.0.0.1:{port}/telegram")
+                # 等待更新队列中的更新处理完成
+                for _ in range(50):
+                    if application.update_queue.empty():
+                        break
+                    await asyncio.sleep(0.02)
+                await asyncio.sleep(0.1)
+            finally:
+                await driver.stop_webhook()
+                await application.stop()
+    finally:
+        await bot_api.close()
+    return messages
+
+
+def test_only_correct_secret_token_is_accepted(context):
+    async def scenario(session, url):
+        async with session.post(url, json=text_update(1, "accepted"), headers={"X-Telegram-Bot-Api-Secret-Token": SECRET}) as response:
+            assert response.status == 200
+        async with session.post(url, json=text_update(2, "wrong"), headers={"X-Telegram-Bot-Api-Secret-Token": "wrong"}) as response:
+            assert response.status == 403
+        async with session.post(url, json=text_update(3, "missing")) as response:
+            assert response.status == 403
+
+    messages = asyncio.run(run_webhook(scenario))
+    assert [message.content for message in messages] == ["accepted"]
+    assert messages[0].channel.id == "-100"
+    assert messages[0].user.id == "42"